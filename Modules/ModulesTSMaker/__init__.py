@@ -1,4 +1,7 @@
-__all__ = ['cycle_resolution',
+__all__ = ['catalog',
+           'cycle_resolution',
            'include',
+           'include_cache',
            'mapping',
+           'module_graph',
            'util']
@@ -0,0 +1,179 @@
+import os
+from hashlib import md5
+
+from utils import discovery, strip_folder
+
+KIND_HEADER = 'header'
+KIND_SOURCE = 'source'
+KIND_CPPM = 'cppm'
+KIND_OTHER = 'other'
+
+
+class FileCatalog():
+  """
+  A file catalog interns the (relative to the source folder) path of every
+  file the tool works with into a compact integer ID, and caches the
+  properties of the files that are otherwise recomputed by multiple passes.
+
+  The kind of a file is one of header, source, cppm (module file), or other.
+  """
+  def __init__(self, srcdir=None, header_regex=None, source_regex=None):
+    self._srcdir = os.path.abspath(srcdir) if srcdir else None
+    self._header_regex = header_regex
+    self._source_regex = source_regex
+
+    self._ids = dict()
+    self._paths = list()
+    self._kinds = list()
+    self._sizes = list()
+    self._mtimes = list()
+    self._hashes = list()
+
+    # Cache for the results of :func relpath:.
+    self._relpaths = dict()
+
+  def __contains__(self, path):
+    return path in self._ids
+
+  def __len__(self):
+    return len(self._paths)
+
+  def __iter__(self):
+    return iter(self._paths)
+
+  def _classify(self, path):
+    if path.endswith('.cppm'):
+      return KIND_CPPM
+    if self._header_regex and self._header_regex.search(path):
+      return KIND_HEADER
+    if self._source_regex and self._source_regex.search(path):
+      return KIND_SOURCE
+    return KIND_OTHER
+
+  def _add(self, path, size, mtime):
+    file_id = len(self._paths)
+    self._ids[path] = file_id
+    self._paths.append(path)
+    self._kinds.append(self._classify(path))
+    self._sizes.append(size)
+    self._mtimes.append(mtime)
+    self._hashes.append(None)
+    return file_id
+
+  def scan(self, excluded_directories=None, use_gitignore=True):
+    """
+    Walk the source folder of the catalog with
+    :func utils.discovery.find_files: (skipping :param excluded_directories:
+    and, if :param use_gitignore: is set, the ignored files), and add every
+    file found to it.
+
+    The size and modification time of the files are only queried when they
+    are first requested.
+    """
+    if not self._srcdir:
+      raise ValueError("Cannot scan a catalog without a source folder.")
+
+    for path in discovery.find_files(self._srcdir, '', excluded_directories,
+                                     use_gitignore):
+      if path not in self._ids:
+        self._add(path, None, None)
+
+  def relpath(self, path):
+    """
+    :return: The given :param path: relative to the source folder of the
+    catalog, in the same format as :func utils.strip_folder: creates it.
+    The results are cached.
+    """
+    ret = self._relpaths.get(path, None)
+    if ret is None:
+      ret = strip_folder(self._srcdir or os.curdir, path)
+      self._relpaths[path] = ret
+    return ret
+
+  def get_id(self, path):
+    """
+    :return: The ID of the file at :param path:. The file is added to the
+    catalog if it was not known before.
+    """
+    file_id = self._ids.get(path, None)
+    if file_id is None:
+      file_id = self._add(path, None, None)
+    return file_id
+
+  def find_id(self, path):
+    """
+    :return: The ID of the file at :param path:, or None if the file is not
+    in the catalog.
+    """
+    return self._ids.get(path, None)
+
+  def get_path(self, file_id):
+    return self._paths[file_id]
+
+  def get_kind(self, path):
+    """
+    :return: The kind of the file at :param path:. (Files not in the catalog
+    are classified, but not added to it.)
+    """
+    file_id = self._ids.get(path, None)
+    if file_id is None:
+      return self._classify(path)
+    return self._kinds[file_id]
+
+  def is_header(self, path):
+    return self.get_kind(path) == KIND_HEADER
+
+  def _stat(self, file_id):
+    if self._sizes[file_id] is not None:
+      return
+
+    path = self._paths[file_id]
+    if self._srcdir and not os.path.isabs(path):
+      path = os.path.join(self._srcdir, path)
+    try:
+      stat = os.stat(path)
+      self._sizes[file_id] = stat.st_size
+      self._mtimes[file_id] = stat.st_mtime_ns
+    except OSError:
+      pass
+
+  def get_size(self, path):
+    """
+    :return: The size of the file, or None if the file is not in the catalog.
+    """
+    file_id = self._ids.get(path, None)
+    if file_id is None:
+      return None
+    self._stat(file_id)
+    return self._sizes[file_id]
+
+  def get_mtime(self, path):
+    """
+    :return: The modification time of the file, in nanoseconds, or None if
+    the file is not in the catalog.
+    """
+    file_id = self._ids.get(path, None)
+    if file_id is None:
+      return None
+    self._stat(file_id)
+    return self._mtimes[file_id]
+
+  def get_content_hash(self, path):
+    """
+    :return: The hash of the contents of the file. The hash is only
+    calculated when it is first requested, as it requires reading the file.
+    None is returned if the file is not in the catalog or cannot be read.
+    """
+    file_id = self._ids.get(path, None)
+    if file_id is None:
+      return None
+    if self._hashes[file_id] is None:
+      full_path = self._paths[file_id]
+      if self._srcdir and not os.path.isabs(full_path):
+        full_path = os.path.join(self._srcdir, full_path)
+      try:
+        with open(full_path, 'rb') as handle:
+          self._hashes[file_id] = md5(handle.read()).hexdigest()
+      except OSError:
+        return None
+    return self._hashes[file_id]
@@ -1,10 +1,16 @@
+import mmap
 import os
+import re
 import sys
-from itertools import filterfalse
+from hashlib import md5
 from operator import itemgetter
 
-from utils import logging, partition
-from utils.progress_bar import tqdm
+from utils import logging
+
+# An '#include' directive (allowing whitespace around the '#'), with the
+# opening delimiter of the included file's name and the name in the groups.
+INCLUDE_DIRECTIVE = re.compile(
+  rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^<>"\r\n]*)[>"]', re.MULTILINE)
 
 
 def directive_to_filename(line):
@@ -23,27 +29,165 @@ def filename_to_directive(filename):
   return '#include "%s"' % filename
 
 
-def get_included_files(text):
+def _find_include_directives(content):
+  """
+  Generate the (line number, opening delimiter, included file) of the include
+  directives in the :param content: buffer of bytes, in the order of the
+  lines. (Lines are separated by '\\n'.)
+
+  Only the names of the included files are decoded.
+  """
+  line, position = 0, 0
+  for match in INCLUDE_DIRECTIVE.finditer(content):
+    line += content[position:match.start()].count(b'\n')
+    position = match.start()
+    yield line, match.group(1), match.group(2).decode('utf-8',
+                                                      errors='replace')
+
+
+def scan_include_directives(content):
+  """
+  :return: The (line number, included file) pairs of the '#include'
+  directives in the :param content: buffer of bytes, in the alphabetical
+  order of the directives.
+
+  >>> scan_include_directives(b'#include "b.h"\\n'
+  ...                         b'  #  include <a.h>\\n'
+  ...                         b'int x; // #include "comment.h"\\n'
+  ...                         b'#include\\t"dir/c.h" // Comment.\\r\\n'
+  ...                         b'#define INCLUDE "d.h"\\n'
+  ...                         b'#include <broken.h\\n')
+  [(0, 'b.h'), (3, 'dir/c.h'), (1, 'a.h')]
+  """
+  return list(map(itemgetter(0, 2), sorted(
+    _find_include_directives(content),
+    key=lambda directive: (directive[1], directive[2], directive[0]))))
+
+
+def scan_file(filename):
   """
-  Filters the given source text for include directives and returns the file
-  names included (as the directives specify, the include paths are not
-  searched).
+  Read :param filename: and scan its include directives with
+  :func scan_include_directives:. Only plain data is returned, so files can
+  be scanned in worker processes.
+
+  :return: The include directives, the hash of the contents of the file (in
+  the format of :func FileCatalog.get_content_hash:) and None, or None, None
+  and the error message if the file could not be read.
   """
-  # QUESTION: Maybe a better approach is needed, like 'clang-scan-deps'?
-  return list(map(directive_to_filename,
-                  filter(lambda line: line.startswith('#include '),
-                         text.splitlines())))
+  try:
+    with open(filename, 'rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        # (Empty files cannot be mapped.)
+        return list(), md5().hexdigest(), None
+
+      with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+        return scan_include_directives(content), \
+               md5(content).hexdigest(), \
+               None
+  except OSError as e:
+    return None, None, str(e)
 
 
-def filter_imports_from_includes(filename,
-                                 text,
-                                 modulemap,
-                                 dependency_map,
-                                 include_paths):
+class IncludeResolver():
+  """
+  Resolves the files included by '#include' directives to the fragments of a
+  module map: the included file is searched as spelled, then relative to the
+  directory of the including file, then in the include paths, in order.
+
+  The fragments are indexed once by their paths relative to the include
+  paths, and the results are memoized by the directory of the including file
+  and the spelling of the include, so resolving is a dictionary lookup. The
+  set of fragments must not change while the resolver is in use.
+
+  >>> from ModulesTSMaker.mapping import ModuleMapping
+  >>> modules = ModuleMapping()
+  >>> modules.add_module('M', 'M.cppm')
+  >>> for fragment in ['a.h', 'src/a.h', 'src/b.h', 'inc/b.h', 'inc/c.h',
+  ...                  'ext/c.h', 'ext/sub/d.h']:
+  ...   modules.add_fragment('M', fragment)
+  >>> resolver = IncludeResolver(modules, ['ext/', 'inc'])
+
+  The file is looked for as spelled, then next to the including file, then
+  in the include paths, in their order:
+
+  >>> resolver.resolve('src/main.cpp', 'a.h')
+  'a.h'
+  >>> resolver.resolve('src/main.cpp', 'b.h')
+  'src/b.h'
+  >>> resolver.resolve('lib/main.cpp', 'b.h')
+  'inc/b.h'
+  >>> resolver.resolve('lib/main.cpp', 'c.h')
+  'ext/c.h'
+  >>> resolver.resolve('lib/main.cpp', 'sub/d.h')
+  'ext/sub/d.h'
+  >>> resolver.resolve('lib/main.cpp', 'd.h') is None
+  True
+  """
+  def __init__(self, modulemap, include_paths=None):
+    self._fragments = set(modulemap.get_all_fragments())
+
+    # (spelling of the include, directory of the including file) -> fragment
+    self._memo = dict()
+
+    # spelling of the include -> (index of the include path, fragment) with
+    # the first include path the spelling can be found in.
+    priorities = dict()
+    for priority, include_dir in enumerate(include_paths or []):
+      priorities.setdefault(include_dir, priority)
+
+    self._index = dict()
+    for fragment in self._fragments:
+      # Every include directory which the fragment is in, with or without a
+      # trailing '/', is a prefix of its path up to a '/'.
+      separator = fragment.find('/')
+      while separator != -1:
+        for include_dir in (fragment[:separator], fragment[:separator + 1]):
+          priority = priorities.get(include_dir, None)
+          if priority is None:
+            continue
+
+          spelling = fragment[separator + 1:]
+          indexed = self._index.get(spelling, None)
+          if indexed is None or indexed[0] > priority:
+            self._index[spelling] = (priority, fragment)
+        separator = fragment.find('/', separator + 1)
+
+  def resolve(self, including_file, spelling):
+    """
+    :return: The fragment the include of :param spelling: in
+    :param including_file: refers to, or None if the included file is not a
+    fragment of any module.
+    """
+    directory = os.path.dirname(including_file)
+    key = (spelling, directory)
+    try:
+      return self._memo[key]
+    except KeyError:
+      pass
+
+    if spelling in self._fragments:
+      ret = spelling
+    else:
+      ret = os.path.join(directory, spelling)
+      if ret not in self._fragments:
+        ret = self._index.get(spelling, (None, None))[1]
+
+    self._memo[key] = ret
+    return ret
+
+
+def resolve_include_directives(filename,
+                               include_lines,
+                               modulemap,
+                               dependency_map,
+                               include_paths,
+                               resolver=None):
   """
-  Using the given :param modulemap:, filter the :param text: into a source
-  code which does not contain '#include' statements to files that are mapped
-  to any module. (Includes that are not mapped to any module remain.)
+  Using the given :param modulemap:, decide which of the :param include_lines:
+  (the (line number, included file) pairs found by
+  :func scan_include_directives: in :param filename:) include files that are
+  mapped to any module, and should be removed from the file. (Includes that
+  are not mapped to any module remain.)
 
   :param dependency_map: The function's call builds the dependency map, which
   specifies that what files belonging to a module depend on what files
@@ -51,79 +195,44 @@ def filter_imports_from_includes(filename,
 
   :param include_paths: Additional include paths discovered from the project.
 
-  :returns: The line numbers and line contents of lines that should be removed,
-  and the list of include directives (and line numbers) that should be kept.
+  :param resolver: An :type IncludeResolver: for :param modulemap: and
+  :param include_paths:, which is created if not given.
+
+  :returns: The line numbers and included files of the lines that should be
+  removed, and the ones of the include directives that should be kept.
   """
-  if not include_paths:
-      include_paths = []
-
-  # Get the "first" module from the module map read earlier which contains
-  # the included file as its own include (so the included file's code is
-  # in the said module).
-  # First is good enough as the module map is expected to had been uniqued out
-  # earlier.
-  def __get_module(include):
-    return next(modulemap.get_modules_for_fragment(include), None)
-
-  # Rearrange the include statements so all of them are on the top, and for
-  # easier rewriting to "import", in alphabetical order.
-  original_lines = list(enumerate(text.splitlines(True)))
-  include_lines, other_lines = partition(
-    lambda line: not line[1].startswith("#include"), original_lines)
-  include_lines = sorted(include_lines, key=itemgetter(1))
+  # (The include statements are handled in alphabetical order, for easier
+  # rewriting to "import".)
   if not include_lines:
     # If the file contains no "#include" statements, no need to do anything.
     return list(), list()
+  if resolver is None:
+    resolver = IncludeResolver(modulemap, include_paths)
 
   lines_to_keep = []
-  for i, line in tqdm(include_lines,
-                      unit='directive',
-                      desc=os.path.basename(filename),
-                      position=0,
-                      leave=False):
-    included = directive_to_filename(line)
+  for i, included in include_lines:
     if not included:
       continue
 
-    module = __get_module(included)
-    if not module:
-      # If no module is found for the include, it might have been an include
-      # from the local folder. Let's try that way first...
-      original_included = included
-      try_include_dirs = [os.path.dirname(filename)] + include_paths
-      for include_dir in try_include_dirs:
-        included = os.path.join(include_dir, original_included)
-        module = __get_module(included)
-        if module:
-          logging.verbose("%s: Include '%s' resolved as '%s'"
-                          % (filename, original_included, included),
-                          file=sys.stderr)
-          break
-
-      if not module:
-        logging.normal("%s: Include file '%s' not found in module mapping."
-                       % (filename, original_included),
-                       file=sys.stderr)
-        lines_to_keep.append((i, line))
-        continue
-
-    dependency_map.add_dependency(filename, included, 'uses')
-
-  def _keep_line(line):
-    """
-    Predicate to check if :param line: is to be kept in the file once the
-    dependencies had been synthesised from it.
-    """
-    if line in other_lines:
-      # Every line that is not an include line is kept.
-      return True
-    if line in include_lines:
-      # For lines that are include statements, only keep them if we marked them
-      # for keeping earlier.
-      return line in lines_to_keep
-
-    # Lines we don't know nothing about should be kept too.
-    return True
-
-  return list(filterfalse(_keep_line, original_lines)), \
+    # If the include is not a file in a module as spelled, it might have been
+    # an include from the local folder, or from the include paths.
+    fragment = resolver.resolve(filename, included)
+    if not fragment:
+      logging.normal("%s: Include file '%s' not found in module mapping."
+                     % (filename, included),
+                     file=sys.stderr)
+      lines_to_keep.append((i, included))
+      continue
+    if fragment != included:
+      logging.verbose("%s: Include '%s' resolved as '%s'"
+                      % (filename, included, fragment),
+                      file=sys.stderr)
+
+    dependency_map.add_dependency(filename, fragment, 'uses')
+
+  # Only the include statements marked for keeping earlier are kept. (Every
+  # line that is not an include line is kept.)
+  linenos_to_keep = set(map(itemgetter(0), lines_to_keep))
+  return list(filter(lambda line: line[0] not in linenos_to_keep,
+                     sorted(include_lines))), \
          lines_to_keep
@@ -0,0 +1,84 @@
+import pickle
+import sqlite3
+
+
+class IncludeScanCache():
+  """
+  A persistent cache of the include directives scanned from the files (see
+  :func include.scan_file:), stored in an SQLite database, so the unchanged
+  files are not read and parsed again in the later passes and runs.
+
+  The entries are keyed by the path of the file, and validated by the
+  fingerprint of the file: if its size and modification time are unchanged,
+  the file is not read at all. Otherwise the entry is still used if the hash
+  of the file's contents is unchanged.
+  """
+
+  # The version of the format of the cached directives. Changing the scanning
+  # must increase this, which drops the previously cached entries.
+  VERSION = 2
+
+  def __init__(self, database):
+    self.hits = 0
+    self.misses = 0
+
+    self._connection = sqlite3.connect(database)
+    version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+    if version != self.VERSION:
+      self._connection.execute("DROP TABLE IF EXISTS includes")
+      self._connection.execute("PRAGMA user_version = %d" % self.VERSION)
+    self._connection.execute("CREATE TABLE IF NOT EXISTS includes ("
+                             "path TEXT PRIMARY KEY, "
+                             "size INTEGER, "
+                             "mtime INTEGER, "
+                             "hash TEXT, "
+                             "directives BLOB)")
+
+  def lookup(self, path, size, mtime, content_hash):
+    """
+    :param content_hash: A callable returning the hash of the contents of the
+    file, only called if the size or the modification time of the file
+    changed since it was cached.
+
+    :return: The cached directives of the file at :param path:, or None if
+    the file is not cached or has changed.
+    """
+    row = self._connection.execute(
+      "SELECT size, mtime, hash, directives FROM includes WHERE path = ?",
+      (path,)).fetchone()
+    if row is not None and size is not None:
+      cached_size, cached_mtime, cached_hash, directives = row
+      if (cached_size, cached_mtime) == (size, mtime):
+        self.hits += 1
+        return pickle.loads(directives)
+
+      if content_hash() == cached_hash:
+        # The file was only touched, remember its new fingerprint.
+        self._connection.execute(
+          "UPDATE includes SET size = ?, mtime = ? WHERE path = ?",
+          (size, mtime, path))
+        self.hits += 1
+        return pickle.loads(directives)
+
+    self.misses += 1
+    return None
+
+  def store(self, path, size, mtime, content_hash, directives):
+    """
+    Cache the :param directives: scanned from the file at :param path:, with
+    the given fingerprint.
+    """
+    if size is None or content_hash is None:
+      # (Files that could not be fingerprinted cannot be validated later.)
+      return
+
+    self._connection.execute(
+      "INSERT OR REPLACE INTO includes VALUES (?, ?, ?, ?, ?)",
+      (path, size, mtime, content_hash, pickle.dumps(directives)))
+
+  def commit(self):
+    self._connection.commit()
+
+  def close(self):
+    self._connection.commit()
+    self._connection.close()
@@ -1,9 +1,15 @@
 import codecs
+import itertools
 import os
 import re
 import sys
+from array import array
+from bisect import bisect_left
 from collections import Counter
+from contextlib import nullcontext
+from functools import partial
 from hashlib import md5
+from multiprocessing.pool import ThreadPool
 from operator import itemgetter
 
 try:
@@ -14,12 +20,16 @@ except ImportError as e:
         "system, or preferably create a virtualenv.")
   raise
 
-from utils import logging, strip_folder, walk_folder
+from utils import discovery, logging, strip_folder, write_file_if_changed
+from utils.graph import cyclic_components, sample_cycle
 from utils.progress_bar import tqdm
 from . import include
+from .catalog import FileCatalog
 
 MODULE_MACRO = re.compile(r'FULL_NAME_(?P<name>[\w_\-\d]+)?;[\s]*$')
 MEMORY_ONLY_MODULE_BACKING_FILENAME = os.devnull
+# The number of include cycles reported for a module that cannot be sorted.
+CYCLE_SAMPLE_LIMIT = 16
 
 
 def substitute_module_macro(name):
@@ -35,40 +45,179 @@ class ModuleMapping():
   """
   A module mapping contains the list of fragment files, inclusion directives
   that are known to be mapped into a particular module file.
+
+  Fragments are stored by their IDs in the :type FileCatalog: of the mapping.
+  Modules are stored by an ID too, which is kept when the module is renamed.
   """
-  def __init__(self):
+  def __init__(self, catalog=None):
+    self._catalog = catalog if catalog is not None else FileCatalog()
     self._map = dict()
 
+    # The IDs of module names, and the names of module IDs. A name keeps its
+    # ID even if the module is deleted, so references to deleted modules
+    # resolve to the same module if it is added again.
+    self._module_ids = dict()
+    self._module_names = list()
+
+    # Reverse index of the fragments: fragment ID -> {module ID: None}. (The
+    # inner dicts, just like the 'fragments' of the modules, are used as sets
+    # which keep the insertion order.)
+    self._fragment_index = dict()
+
+    # Reverse index of the imports: module ID -> set(importing module IDs).
+    self._importers = dict()
+
+    # The functions called as f(module ID, dependency ID, added) when an
+    # import of a module is added or removed, and as f(module ID) when a
+    # module is renamed. (See :type ModuleGraph:.)
+    self._import_observers = list()
+    self._rename_observers = list()
+
+  def __getstate__(self):
+    # (The observers are local to the current process.)
+    state = dict(self.__dict__)
+    state['_import_observers'] = list()
+    state['_rename_observers'] = list()
+    return state
+
   def __contains__(self, module):
-    return module in self._map.keys()
+    return self._module_ids.get(module, None) in self._map
 
   def __len__(self):
-    return len(self._map.keys())
+    return len(self._map)
 
   def __iter__(self):
-    return iter(self._map.keys())
+    return iter(list(map(self._module_names.__getitem__, self._map)))
 
   def __delitem__(self, module):
     if module not in self:
       return
-    del self._map[module]
+
+    module_id = self._module_ids[module]
+    for fragment_id in self._map[module_id]['fragments']:
+      self._unindex_fragment(module_id, fragment_id)
+    for dependency_id in self._map[module_id]['imported-modules']:
+      self._unindex_import(module_id, dependency_id)
+      self._notify_import(module_id, dependency_id, False)
+    del self._map[module_id]
+
+  def get_catalog(self):
+    """
+    :return: The :type FileCatalog: the fragments of the mapping are
+    identified with.
+    """
+    return self._catalog
+
+  def _get_module_id(self, module):
+    """
+    :return: The ID of :param module:. A new ID is created if the name is not
+    known yet, even if no such module is added.
+    """
+    module_id = self._module_ids.get(module, None)
+    if module_id is None:
+      module_id = len(self._module_names)
+      self._module_ids[module] = module_id
+      self._module_names.append(module)
+    return module_id
+
+  def _find_module_id(self, module):
+    """
+    :return: The ID of :param module:, or None if the module is not in the
+    mapping.
+    """
+    module_id = self._module_ids.get(module, None)
+    return module_id if module_id in self._map else None
+
+  def _get_module_name(self, module_id):
+    return self._module_names[module_id]
+
+  def _has_module_id(self, module_id):
+    return module_id in self._map
+
+  def add_import_observer(self, observer):
+    """
+    Register :param observer: to be called as
+    `observer(module ID, dependency ID, added)` whenever a module starts
+    (added is True) or stops (added is False) importing another one.
+    """
+    self._import_observers.append(observer)
+
+  def remove_import_observer(self, observer):
+    self._import_observers.remove(observer)
+
+  def _notify_import(self, module_id, dependency_id, added):
+    for observer in self._import_observers:
+      observer(module_id, dependency_id, added)
+
+  def add_rename_observer(self, observer):
+    """
+    Register :param observer: to be called as `observer(module ID)` whenever
+    a module is renamed (after the rename).
+    """
+    self._rename_observers.append(observer)
+
+  def remove_rename_observer(self, observer):
+    self._rename_observers.remove(observer)
+
+  def _get_entry(self, module):
+    return self._map[self._module_ids[module]]
 
   def add_module(self, module, backing_file):
     if module in self:
       raise KeyError("Cannot add a module twice.")
 
-    self._map[module] = {'file': backing_file,
-                         'fragments': [],
-                         'imported-modules': set(),
-                         'tainted': True
-                         }
+    self._map[self._get_module_id(module)] = {'file': backing_file,
+                                              'fragments': dict(),
+                                              'imported-modules': set(),
+                                              'tainted': True,
+                                              'name-fixed': False
+                                              }
+
+  def rename_module(self, module, new_name):
+    """
+    Rename :param module: to :param new_name:. The module keeps its ID, so
+    the fragments, and the dependencies kept by ID (e.g. in a
+    :type DependencyMap:), do not need to be changed. The renamed module and
+    the modules importing it are marked tainted.
+    """
+    if module not in self:
+      raise KeyError("Module '%s' not found in the module mapping." % module)
+    if module == new_name:
+      return
+    if new_name in self:
+      raise KeyError("Cannot rename '%s' to '%s' because that module already "
+                     "exists." % (module, new_name))
+
+    module_id = self._module_ids.pop(module)
+    self._module_ids[new_name] = module_id
+    self._module_names[module_id] = new_name
+
+    self._map[module_id]['tainted'] = True
+    for importer_id in self._importers.get(module_id, ()):
+      if importer_id in self._map:
+        self._map[importer_id]['tainted'] = True
+
+    for observer in self._rename_observers:
+      observer(module_id)
+
+  def _is_name_fixed(self, module):
+    """
+    :return: Whether the name of :param module: was fixed by
+    :func fix_module_names: and the fragments of the module did not change
+    since.
+    """
+    return self._get_entry(module)['name-fixed']
+
+  def _set_name_fixed(self, module):
+    self._get_entry(module)['name-fixed'] = True
 
   def set_backing_file(self, module, backing_file):
     if module not in self:
       raise KeyError("Cannot set the backing file of a module that has not "
                      "been added.")
-    self._map[module]['file'] = backing_file
-    self._map[module]['tainted'] = True
+    entry = self._get_entry(module)
+    entry['file'] = backing_file
+    entry['tainted'] = True
 
   def set_not_tainted(self, module=None):
     """
@@ -77,48 +226,192 @@ class ModuleMapping():
     if module:
       if module not in self:
         raise KeyError("Cannot untaint a module that has not been added.")
-      self._map[module]['tainted'] = False
+      self._get_entry(module)['tainted'] = False
     else:
-      for key in self:
-        self._map[key]['tainted'] = False
+      for entry in self._map.values():
+        entry['tainted'] = False
 
   def add_fragment(self, module, fragment_file):
     if module not in self:
       raise KeyError("Cannot add a fragment to a module that has not been "
                      "added.")
-    self._map[module]['fragments'].append(fragment_file)
-    self._map[module]['tainted'] = True
+    self._add_fragment_id(self._module_ids[module],
+                          self._catalog.get_id(fragment_file))
+
+  def _add_fragment_id(self, module_id, fragment_id):
+    self._map[module_id]['fragments'][fragment_id] = None
+    self._map[module_id]['tainted'] = True
+    self._map[module_id]['name-fixed'] = False
 
-  def remove_fragment(self, fragment_file):
+    modules_of_fragment = self._fragment_index.get(fragment_id, None)
+    if modules_of_fragment is None:
+      modules_of_fragment = dict()
+      self._fragment_index[fragment_id] = modules_of_fragment
+    modules_of_fragment[module_id] = None
+
+  def _unindex_fragment(self, module_id, fragment_id):
+    """
+    Remove the :param module_id: from the reverse index entry of
+    :param fragment_id:.
+    """
+    modules_of_fragment = self._fragment_index.get(fragment_id, None)
+    if modules_of_fragment is None:
+      return
+
+    modules_of_fragment.pop(module_id, None)
+    if not modules_of_fragment:
+      del self._fragment_index[fragment_id]
+
+  def _unindex_import(self, module_id, dependency_id):
+    importers = self._importers.get(dependency_id, None)
+    if importers is None:
+      return
+
+    importers.discard(module_id)
+    if not importers:
+      del self._importers[dependency_id]
+
+  def remove_fragment(self, fragment_file, remove_empty_modules=True):
     """
     Unmaps the given :param fragment_file: from all modules it is mapped to.
+
+    :param remove_empty_modules: If True, the modules which lost their last
+    fragment due to this removal are removed from the mapping.
     """
-    modules_gone_empty = list()
-    for module in self.filter_modules_for_fragments([fragment_file]):
-      self._map[module]['fragments'].remove(fragment_file)
-      self._map[module]['tainted'] = True
+    fragment_id = self._catalog.find_id(fragment_file)
+    if fragment_id is not None:
+      self._remove_fragment_id(fragment_id, remove_empty_modules)
+
+  def _remove_fragment_id(self, fragment_id, remove_empty_modules=True):
+    modules_of_fragment = self._fragment_index.pop(fragment_id, None)
+    if not modules_of_fragment:
+      return
 
-      if not self._map[module]['fragments']:
-        modules_gone_empty.append(module)
+    for module_id in modules_of_fragment:
+      del self._map[module_id]['fragments'][fragment_id]
+      self._map[module_id]['tainted'] = True
+      self._map[module_id]['name-fixed'] = False
+
+      if remove_empty_modules and not self._map[module_id]['fragments']:
+        del self[self._module_names[module_id]]
+
+  def _save_state(self, module_ids, fragment_ids):
+    """
+    Create a copy of the parts of the mapping that belong to the given
+    :param module_ids: and :param fragment_ids:, which can be used to roll
+    back the mapping to the current state with :func _restore_state:.
+    """
+    saved_modules = dict()
+    for module_id in module_ids:
+      entry = self._map.get(module_id, None)
+      if entry is not None:
+        entry = dict(entry)
+        entry['fragments'] = dict(entry['fragments'])
+        entry['imported-modules'] = set(entry['imported-modules'])
+      saved_modules[module_id] = entry
+
+    saved_index = dict()
+    for fragment_id in fragment_ids:
+      modules_of_fragment = self._fragment_index.get(fragment_id, None)
+      saved_index[fragment_id] = dict(modules_of_fragment) \
+        if modules_of_fragment is not None else None
+
+    return saved_modules, saved_index
+
+  def _restore_state(self, state):
+    """
+    Roll back the mapping to the :param state: created by :func _save_state:.
+    """
+    saved_modules, saved_index = state
+    for module_id, entry in saved_modules.items():
+      current_entry = self._map.get(module_id, None)
+      old_imports = current_entry['imported-modules'] \
+        if current_entry is not None else set()
+      new_imports = entry['imported-modules'] if entry is not None else set()
+
+      if entry is None:
+        self._map.pop(module_id, None)
+      else:
+        self._map[module_id] = entry
+        for dependency_id in entry['imported-modules']:
+          self._importers.setdefault(dependency_id, set()).add(module_id)
+
+      if self._import_observers:
+        for dependency_id in old_imports - new_imports:
+          self._notify_import(module_id, dependency_id, False)
+        for dependency_id in new_imports - old_imports:
+          self._notify_import(module_id, dependency_id, True)
+
+    for fragment_id, modules_of_fragment in saved_index.items():
+      if modules_of_fragment is None:
+        self._fragment_index.pop(fragment_id, None)
+      else:
+        self._fragment_index[fragment_id] = modules_of_fragment
+
+  def move_fragments(self, moved_files):
+    """
+    Move every fragment in :param moved_files:, a fragment -> new module dict,
+    into its new module. Modules that do not exist yet are created as
+    memory-only modules, and modules that lost every fragment are removed.
+
+    The move is applied atomically: either every fragment is moved, or the
+    mapping is left unchanged.
+    """
+    moved_ids = dict()
+    for fragment, module in moved_files.items():
+      fragment_id = self._catalog.find_id(fragment)
+      if fragment_id is None:
+        raise KeyError("Cannot move '%s' because it is not assigned to any "
+                       "module." % fragment)
+      moved_ids[fragment_id] = self._get_module_id(module)
+
+    self._move_fragment_ids(moved_ids)
+
+  def _move_fragment_ids(self, moved_ids):
+    for fragment_id in moved_ids:
+      if fragment_id not in self._fragment_index:
+        raise KeyError("Cannot move '%s' because it is not assigned to any "
+                       "module." % self._catalog.get_path(fragment_id))
+
+    source_modules = set()
+    for fragment_id in moved_ids:
+      source_modules.update(self._fragment_index[fragment_id])
+    state = self._save_state(source_modules.union(moved_ids.values()),
+                             moved_ids)
 
-    for module in modules_gone_empty:
-      del self._map[module]
+    try:
+      for fragment_id in moved_ids:
+        self._remove_fragment_id(fragment_id, remove_empty_modules=False)
+
+      for fragment_id, module_id in moved_ids.items():
+        if module_id not in self._map:
+          self.add_module(self._module_names[module_id],
+                          MEMORY_ONLY_MODULE_BACKING_FILENAME)
+        self._add_fragment_id(module_id, fragment_id)
+
+      for module_id in source_modules:
+        if module_id in self._map and not self._map[module_id]['fragments']:
+          del self[self._module_names[module_id]]
+    except Exception:
+      self._restore_state(state)
+      raise
 
   def get_filename(self, module):
     if module not in self:
       raise KeyError("Module '%s' not found in the module mapping." % module)
-    return self._map[module]['file']
+    return self._get_entry(module)['file']
 
   def is_tainted(self, module):
     if module not in self:
       raise KeyError("Module '%s' not found in the module mapping." % module)
-    return self._map[module]['tainted']
+    return self._get_entry(module)['tainted']
 
   def get_fragment_list(self, module):
     if module not in self:
       raise KeyError("Cannot get fragments for a module that has not been "
                      "added.")
-    return self._map[module]['fragments']
+    return list(map(self._catalog.get_path,
+                    self._get_entry(module)['fragments']))
 
   def get_all_fragments(self):
     """
@@ -126,18 +419,28 @@ class ModuleMapping():
     in the mapping.
     """
     for v in self._map.values():
-      for f in v['fragments']:
-        yield f
+      for fragment_id in v['fragments']:
+        yield self._catalog.get_path(fragment_id)
 
   def get_modules_for_fragment(self, fragment_file):
     """
     Returns the list of modules where the given :param fragment_file: was
     mapped into.
     """
-    return map(itemgetter(0),  # Return the key, the module's name.
-               filter(
-                 lambda i: fragment_file in i[1]['fragments'],
-                 self._map.items()))
+    return iter(list(map(
+      self._module_names.__getitem__,
+      self._get_modules_for_id(self._catalog.find_id(fragment_file)))))
+
+  def _get_fragment_ids(self, module_id):
+    return list(self._map[module_id]['fragments'])
+
+  def _get_modules_for_id(self, fragment_id):
+    """
+    :return: The IDs of the modules :param fragment_id: is mapped into.
+    """
+    # (Copy the modules, so the caller might change the mapping while
+    # iterating the result.)
+    return iter(list(self._fragment_index.get(fragment_id, ())))
 
   def filter_modules_for_fragments(self, fragments):
     """
@@ -164,36 +467,95 @@ class ModuleMapping():
       raise KeyError("Module '%s' not found in the module mapping."
                      % dependency)
 
-    self._map[module]['imported-modules'].add(dependency)
+    module_id = self._module_ids[module]
+    dependency_id = self._module_ids[dependency]
+    imports = self._map[module_id]['imported-modules']
+    if dependency_id not in imports:
+      imports.add(dependency_id)
+      self._importers.setdefault(dependency_id, set()).add(module_id)
+      self._map[module_id]['tainted'] = True
+      self._notify_import(module_id, dependency_id, True)
+
+  def remove_module_import(self, module, dependency):
+    if module not in self:
+      raise KeyError("Module '%s' not found in the module mapping." % module)
+
+    module_id = self._module_ids[module]
+    dependency_id = self._module_ids.get(dependency, None)
+    imports = self._map[module_id]['imported-modules']
+    if dependency_id in imports:
+      imports.remove(dependency_id)
+      self._unindex_import(module_id, dependency_id)
+      self._map[module_id]['tainted'] = True
+      self._notify_import(module_id, dependency_id, False)
 
   def get_dependencies_of_module(self, module):
     if module not in self:
       raise KeyError("Cannot get dependencies for a module that has not been "
                      "added.")
-    return self._map[module]['imported-modules']
+    return set(map(self._module_names.__getitem__,
+                   self._get_entry(module)['imported-modules']))
 
   def clear_module_imports(self, module):
     if module not in self:
       raise KeyError("Cannot clear dependencies for a module that has not "
                      "been added.")
-    self._map[module]['imported-modules'] = set()
+
+    module_id = self._module_ids[module]
+    entry = self._map[module_id]
+    if entry['imported-modules']:
+      for dependency_id in entry['imported-modules']:
+        self._unindex_import(module_id, dependency_id)
+        self._notify_import(module_id, dependency_id, False)
+      entry['imported-modules'] = set()
+      entry['tainted'] = True
 
 
 class DependencyMap():
   """
   A dependency map contains information of dependencies of (module, file)
   pairs.
+
+  Files are stored by their IDs in the :type FileCatalog: of the attached
+  module mapping, and modules by their IDs in the module mapping. (Thus,
+  renaming a module in the mapping does not affect the dependency map.)
   """
   def __init__(self, module_mapping):
     self._module_mapping = module_mapping
+    self._catalog = module_mapping.get_catalog()
+
+    # module -> file -> dependency module -> kind -> set(dependency files)
     self._map = dict()
 
+    # File-level adjacency indexes in the format of file -> kind -> set(files).
+    # The forward index contains the files a file depends on, and the reverse
+    # index contains the files that depend on a file.
+    self._dependencies = dict()
+    self._dependees = dict()
+
+    # The number of file-level "uses" dependencies between two modules, in the
+    # format of module -> dependency module -> count. A module imports the
+    # other if the count is not zero.
+    self._module_uses_counts = dict()
+
+    # The modules whose import list might have changed since the last
+    # synthesis, in the format of module -> set(dependency modules).
+    self._dirty_imports = dict()
+
+    # The modules implementing the contents of a file, in the format of
+    # implemented file -> implementing module -> set(implementing files).
+    self._implementations = dict()
+
   def __contains__(self, item):
     """
     Returns if a dependency is known for the given file, or module.
     """
-    return item in self._map.keys() or any([item in module
-                                            for module in self._map])
+    if self._module_mapping._find_module_id(item) in self._map:
+      return True
+
+    file_id = self._catalog.find_id(item)
+    return file_id is not None and \
+      (file_id in self._dependencies or file_id in self._dependees)
 
   def get_module_map(self):
     """
@@ -202,6 +564,24 @@ class DependencyMap():
     """
     return self._module_mapping
 
+  @staticmethod
+  def _add_adjacent(index, filename, kind, adjacent_file):
+    adjacency = index.get(filename, None)
+    if adjacency is None:
+      adjacency = {'uses': set(), 'implements': set()}
+      index[filename] = adjacency
+    adjacency[kind].add(adjacent_file)
+
+  @staticmethod
+  def _discard_adjacent(index, filename, kind, adjacent_file):
+    adjacency = index.get(filename, None)
+    if adjacency is None:
+      return
+
+    adjacency[kind].discard(adjacent_file)
+    if not adjacency['uses'] and not adjacency['implements']:
+      del index[filename]
+
   def add_dependency(self, dependee, dependency, kind="uses"):
     """
     Add the dependency that :param dependee: depends on :param dependency:.
@@ -211,10 +591,12 @@ class DependencyMap():
     if kind not in ['uses', 'implements']:
       raise ValueError("'kind' should be either 'uses' or 'implements'.")
 
+    dependee_id = self._catalog.find_id(dependee)
+    dependency_id = self._catalog.find_id(dependency)
     dependee_modules = list(
-      self._module_mapping.get_modules_for_fragment(dependee))
+      self._module_mapping._get_modules_for_id(dependee_id))
     dependency_modules = list(
-      self._module_mapping.get_modules_for_fragment(dependency))
+      self._module_mapping._get_modules_for_id(dependency_id))
 
     if not dependee_modules:
       raise ValueError("Cannot add dependency of '%s' because it is not "
@@ -223,6 +605,19 @@ class DependencyMap():
       raise ValueError("Cannot add dependency for '%s' because it is not "
                        "assigned to any module." % dependency)
 
+    self._link(dependee_id, dependee_modules,
+               dependency_id, dependency_modules,
+               kind)
+    self._add_adjacent(self._dependencies, dependee_id, kind, dependency_id)
+    self._add_adjacent(self._dependees, dependency_id, kind, dependee_id)
+
+  def _link(self, dependee, dependee_modules,
+            dependency, dependency_modules,
+            kind):
+    """
+    Add the :param kind: dependency of :param dependee: on :param dependency:
+    to the module-level map, between the given modules of the files.
+    """
     for mod in dependee_modules:
       if mod not in self._map:
         self._map[mod] = dict()
@@ -231,77 +626,282 @@ class DependencyMap():
 
       for dep in dependency_modules:
         if dep not in self._map[mod][dependee]:
-          self._map[mod][dependee][dep] = {'uses': [],
-                                           'implements': []}
-        if dependency not in self._map[mod][dependee][dep][kind]:
-          self._map[mod][dependee][dep][kind].append(dependency)
+          self._map[mod][dependee][dep] = {'uses': set(),
+                                           'implements': set()}
+        files = self._map[mod][dependee][dep][kind]
+        if kind == 'uses' and dependency not in files:
+          self._count_module_use(mod, dep, 1)
+        files.add(dependency)
+
+      if kind == 'implements':
+        self._add_implementation(mod, dependee, dependency)
+
+  def _count_module_use(self, module, dependency_module, delta):
+    """
+    Change the number of "uses" dependencies from :param module: to
+    :param dependency_module: by :param delta:. If the modules start or stop
+    depending on each other, the import is marked for synthesis.
+    """
+    counts = self._module_uses_counts.get(module, None)
+    if counts is None:
+      counts = dict()
+      self._module_uses_counts[module] = counts
+
+    count = counts.get(dependency_module, 0) + delta
+    if count:
+      counts[dependency_module] = count
+    else:
+      del counts[dependency_module]
+      if not counts:
+        del self._module_uses_counts[module]
+
+    if count == 0 or count == delta:
+      dirty = self._dirty_imports.get(module, None)
+      if dirty is None:
+        dirty = set()
+        self._dirty_imports[module] = dirty
+      dirty.add(dependency_module)
+
+  def _add_implementation(self, module, implementee, implemented):
+    modules = self._implementations.get(implemented, None)
+    if modules is None:
+      modules = dict()
+      self._implementations[implemented] = modules
+
+    files = modules.get(module, None)
+    if files is None:
+      files = set()
+      modules[module] = files
+    files.add(implementee)
+
+  def _discard_implementation(self, module, implementee, implemented):
+    modules = self._implementations.get(implemented, None)
+    if modules is None or module not in modules:
+      return
+
+    modules[module].discard(implementee)
+    if not modules[module]:
+      del modules[module]
+      if not modules:
+        del self._implementations[implemented]
+
+  def _unlink(self, dependee, dependee_modules,
+              dependency, dependency_modules,
+              kind):
+    """
+    Remove the :param kind: dependency of :param dependee: on
+    :param dependency: from the module-level map, between the given modules
+    of the files, cleaning up the entries that emptied out.
+    """
+    for module in dependee_modules:
+      if kind == 'implements':
+        self._discard_implementation(module, dependee, dependency)
+
+      files_in_module = self._map.get(module, None)
+      if not files_in_module or dependee not in files_in_module:
+        continue
+
+      dependee_entry = files_in_module[dependee]
+      for dependency_module in dependency_modules:
+        dependency_filedict = dependee_entry.get(dependency_module, None)
+        if dependency_filedict is None:
+          continue
+
+        files = dependency_filedict[kind]
+        if kind == 'uses' and dependency in files:
+          self._count_module_use(module, dependency_module, -1)
+        files.discard(dependency)
+        if not dependency_filedict['uses'] and \
+              not dependency_filedict['implements']:
+          # Clear module-level dependency if now in fact the file does not
+          # depend on said module anymore.
+          del dependee_entry[dependency_module]
+
+      if not dependee_entry:
+        del files_in_module[dependee]
+      if not files_in_module:
+        del self._map[module]
 
   def remove_file(self, filename):
     """
     Removes the given :param filename: from the dependency map. Every
     depedency incident to the file is removed.
     """
-    modules_to_remove = list()
-
-    for module in self._map:
-      if filename in self._map[module]:
-        # Found a module which contains 'filename', and dependency information
-        # of it. File is deleted, so remove the entire inner dict.
-        del self._map[module][filename]
-        if not self._map[module]:
-          # The module has emptied out.
-          modules_to_remove.append(module)
-
-      files_to_remove_from_module = list()
-      for file_in_module in self._map[module]:
-        inner_modules_to_remove = list()
-        for dep_module, dep_filedict in \
-              self._map[module][file_in_module].items():
-          for kind in dep_filedict:
-            if filename in dep_filedict[kind]:
-              # Remove the file from every file's dependency list, if found.
-              dep_filedict[kind].remove(filename)
-
-          if all(not line for line in dep_filedict.values()):
-            # The dependency list of module 'dep_module' for
-            # 'file_in_module' has emptied out, remove this entry.
-            inner_modules_to_remove.append(dep_module)
-
-        for remove_module in inner_modules_to_remove:
-          # Clear module-level dependency if now in fact the file does not
-          # depend on said module anymore.
-          del self._map[module][file_in_module][remove_module]
+    file_id = self._catalog.find_id(filename)
+    if file_id is None:
+      return
+    file_modules = list(self._module_mapping._get_modules_for_id(file_id))
+
+    # The file is deleted, so remove every dependency of it. (This also
+    # clears the file's entries in the module-level map.)
+    for kind, dependencies in \
+          self._dependencies.pop(file_id, dict()).items():
+      for dependency in dependencies:
+        self._discard_adjacent(self._dependees, dependency, kind, file_id)
+        self._unlink(
+          file_id,
+          file_modules,
+          dependency,
+          list(self._module_mapping._get_modules_for_id(dependency)),
+          kind)
+
+    # Remove the file from every file's dependency list.
+    for kind, dependees in self._dependees.pop(file_id, dict()).items():
+      for dependee in dependees:
+        self._discard_adjacent(self._dependencies, dependee, kind, file_id)
+        self._unlink(
+          dependee,
+          list(self._module_mapping._get_modules_for_id(dependee)),
+          file_id,
+          file_modules,
+          kind)
+
+  def _get_incident_dependencies(self, file_ids):
+    """
+    :return: The set of (dependee, dependency, kind) dependencies which have
+    at least one of :param file_ids: on either end.
+    """
+    ret = set()
+    for filename in file_ids:
+      for kind, dependencies in \
+            self._dependencies.get(filename, dict()).items():
+        ret.update((filename, dependency, kind)
+                   for dependency in dependencies)
+      for kind, dependees in self._dependees.get(filename, dict()).items():
+        ret.update((dependee, filename, kind) for dependee in dependees)
+
+    return ret
+
+  def move_files(self, moved_files):
+    """
+    Move the files of :param moved_files:, a file -> new module dict, to their
+    new modules, both in the attached module mapping and in the current
+    instance. Only the dependencies incident to the moved files are touched,
+    as file-to-file dependencies do not change by moving.
+
+    The move is transactional: if it fails, both the module mapping and the
+    dependency map are rolled back to their original state.
+    """
+    moved_ids = dict()
+    for filename, module in moved_files.items():
+      if not module:
+        raise ValueError("Cannot move '%s' to a module without a name."
+                         % filename)
+
+      file_id = self._catalog.find_id(filename)
+      if file_id is None:
+        raise KeyError("Cannot move '%s' because it is not assigned to any "
+                       "module." % filename)
+      moved_ids[file_id] = self._module_mapping._get_module_id(module)
+    moved_files = moved_ids
+
+    dependencies_to_fix_up = self._get_incident_dependencies(moved_files)
+
+    # Resolve the modules of each affected file only once, both for before
+    # and after the move.
+    modules_before, modules_after = dict(), dict()
+    for filename in itertools.chain(
+          moved_files,
+          itertools.chain.from_iterable(
+            map(itemgetter(0, 1), dependencies_to_fix_up))):
+      if filename in modules_before:
+        continue
+      modules_before[filename] = list(
+        self._module_mapping._get_modules_for_id(filename))
+      modules_after[filename] = [moved_files[filename]] \
+        if filename in moved_files else modules_before[filename]
+
+    # Save the parts of the maps that the move can change, for rollback.
+    saved_module_mapping = self._module_mapping._save_state(
+      set(itertools.chain.from_iterable(
+        modules_before[f] + modules_after[f] for f in moved_files)),
+      moved_files)
+    saved_map = dict()
+    for dependee, _, _ in dependencies_to_fix_up:
+      for module in modules_before[dependee] + modules_after[dependee]:
+        if (module, dependee) in saved_map:
+          continue
+        entry = self._map.get(module, dict()).get(dependee, None)
+        if entry is not None:
+          entry = {dependency_module: {kind: set(files)
+                                       for kind, files in filedict.items()}
+                   for dependency_module, filedict in entry.items()}
+        saved_map[(module, dependee)] = entry
+
+    saved_implementations = dict()
+    for _, dependency, kind in dependencies_to_fix_up:
+      if kind != 'implements' or dependency in saved_implementations:
+        continue
+      modules = self._implementations.get(dependency, None)
+      if modules is not None:
+        modules = {module: set(files) for module, files in modules.items()}
+      saved_implementations[dependency] = modules
+
+    saved_counts = dict()
+    for dependee, dependency, _ in dependencies_to_fix_up:
+      for module in modules_before[dependee] + modules_after[dependee]:
+        for dependency_module in \
+              modules_before[dependency] + modules_after[dependency]:
+          saved_counts[(module, dependency_module)] = \
+            self._module_uses_counts.get(module, dict()).get(dependency_module,
+                                                             0)
+
+    try:
+      for dependee, dependency, kind in dependencies_to_fix_up:
+        self._unlink(dependee, modules_before[dependee],
+                     dependency, modules_before[dependency],
+                     kind)
+
+      self._module_mapping._move_fragment_ids(moved_files)
+
+      for dependee, dependency, kind in dependencies_to_fix_up:
+        # Fix the dependency map so the file->file dependencies now point
+        # through the new module names.
+        self._link(dependee, modules_after[dependee],
+                   dependency, modules_after[dependency],
+                   kind)
+    except Exception:
+      self._module_mapping._restore_state(saved_module_mapping)
+      for (module, dependee), entry in saved_map.items():
+        files_in_module = self._map.get(module, None)
+        if entry is None:
+          if files_in_module is not None:
+            files_in_module.pop(dependee, None)
+            if not files_in_module:
+              del self._map[module]
+          continue
 
-        if not self._map[module][file_in_module]:
-          files_to_remove_from_module.append(file_in_module)
+        if files_in_module is None:
+          files_in_module = dict()
+          self._map[module] = files_in_module
+        files_in_module[dependee] = entry
 
-      for remove_from_module in files_to_remove_from_module:
-        del self._map[module][remove_from_module]
+      for implemented, modules in saved_implementations.items():
+        if modules is None:
+          self._implementations.pop(implemented, None)
+        else:
+          self._implementations[implemented] = modules
 
-    for remove_module in modules_to_remove:
-      del self._map[remove_module]
+      for (module, dependency_module), count in saved_counts.items():
+        current = self._module_uses_counts.get(module, dict()) \
+          .get(dependency_module, 0)
+        if current != count:
+          self._count_module_use(module, dependency_module, count - current)
+      raise
 
   def get_dependencies(self, filename):
     """
     :return: A collection of files :param filename: depends on, across every
     module.
     """
-    ret = {'uses': set(), 'implements': set()}
-    modules = self._module_mapping.get_modules_for_fragment(filename)
-
-    for mod in modules:
-      if mod not in self._map:
-        continue
-      if filename not in self._map[mod]:
-        continue
+    dependencies = self._dependencies.get(self._catalog.find_id(filename),
+                                          None)
+    if not dependencies:
+      return {'uses': set(), 'implements': set()}
 
-      for dependency_module in self._map[mod][filename]:
-        ret['uses'].update(
-          set(self._map[mod][filename][dependency_module]['uses']))
-        ret['implements'].update(
-          set(self._map[mod][filename][dependency_module]['implements']))
-
-    return ret
+    return {'uses': set(map(self._catalog.get_path, dependencies['uses'])),
+            'implements': set(map(self._catalog.get_path,
+                                  dependencies['implements']))}
 
   def get_dependees(self, filename):
     """
@@ -310,13 +910,10 @@ class DependencyMap():
     """
     ret = set()
 
-    for mod in self._map:
-      for dependee_file in self._map[mod]:
-        for dependee_module in self._map[mod][dependee_file]:
-          for kind in self._map[mod][dependee_file][dependee_module]:
-            if filename in \
-                  self._map[mod][dependee_file][dependee_module][kind]:
-              ret.add((dependee_file, kind))
+    for kind, dependees in \
+          self._dependees.get(self._catalog.find_id(filename), dict()).items():
+      for dependee_file in dependees:
+        ret.add((self._catalog.get_path(dependee_file), kind))
 
     return ret
 
@@ -328,16 +925,19 @@ class DependencyMap():
     :return: A dictionary object containing a filename => set of
     (filenames, kind) mapping.
     """
+    from_module = self._module_mapping._find_module_id(from_module)
+    to_module = self._module_mapping._find_module_id(to_module)
+
     ret = dict()
     for from_file in self._map.get(from_module, []):
-      ret[from_file] = set()
+      to_files = set()
       for kind, filelist in self._map[from_module][from_file]\
             .get(to_module, {}).items():
         for to_file in filelist:
-          ret[from_file].add((to_file, kind))
+          to_files.add((self._catalog.get_path(to_file), kind))
 
-      if len(ret[from_file]) == 0:
-        del ret[from_file]
+      if to_files:
+        ret[self._catalog.get_path(from_file)] = to_files
     return ret
 
   def get_intramodule_dependencies(self, module):
@@ -350,110 +950,539 @@ class DependencyMap():
     """
     return self.get_files_creating_dependency_between(module, module)
 
+  def get_implementation_insanity(self):
+    """
+    :return: The files which are implemented by files in multiple modules,
+    in the format of file -> implementing module -> set(implementing files).
+    (See :func get_dependency_map_implementation_insanity:.)
+    """
+    ret = dict()
+    for implemented, modules in self._implementations.items():
+      if len(modules) <= 1:
+        continue
+      if next(self._module_mapping._get_modules_for_id(implemented),
+              None) is None:
+        # Only files still mapped into a module are considered.
+        continue
+
+      ret[self._catalog.get_path(implemented)] = \
+        {self._module_mapping._get_module_name(module):
+         set(map(self._catalog.get_path, files))
+         for module, files in modules.items()}
+
+    return ret
+
   def synthesize_intermodule_imports(self):
     """
     Using the dependencies stored in the current instance, synthesize a
     module-module 'import' list into the :var _module_mapping: of the instance.
+
+    Only the imports of modules whose files gained or lost dependencies since
+    the previous call are recalculated. Modules whose import list changed are
+    marked tainted in the module mapping.
     """
-    for module in self._module_mapping:
-      self._module_mapping.clear_module_imports(module)
+    module_names = self._module_mapping._get_module_name
+    for module, dependency_modules in self._dirty_imports.items():
+      if not self._module_mapping._has_module_id(module):
+        continue
+
+      counts = self._module_uses_counts.get(module, dict())
+      for dependency_module in dependency_modules:
+        # Only consider an other module to be imported if it is *used*, not in
+        # the "implements" relation. Never consider self-dependency.
+        if counts.get(dependency_module, 0) and \
+              dependency_module != module and \
+              self._module_mapping._has_module_id(dependency_module):
+          self._module_mapping.add_module_import(
+            module_names(module), module_names(dependency_module))
+        else:
+          self._module_mapping.remove_module_import(
+            module_names(module), module_names(dependency_module))
+
+    self._dirty_imports = dict()
+
 
-    for module in self._map:
-      module_dependencies = set()
-      for dependency_entry in self._map[module].values():
-        for module_name in dependency_entry:
-          if dependency_entry[module_name]['uses']:
-            # Only consider an other module to be imported if it is *used*, not
-            # in the "implements" relation.
-            module_dependencies.add(module_name)
+class CompactDependencyMap(DependencyMap):
+  """
+  A :type DependencyMap: which stores the file-level dependencies in arrays
+  instead of nested dicts, which uses much less memory for large projects and
+  is cheaper to send to other processes.
+
+  The dependencies are stored as compressed sparse rows (CSR) indexed by file
+  ID: the dependencies of a file are the slice of :var _targets: between the
+  file's offset and the next file's offset, sorted by ID. Each dependency has
+  a mask of the kinds of the dependency. A reverse copy of the arrays is kept
+  for looking up the dependees of a file.
+
+  Changes are not written into the arrays immediately. The changed rows are
+  kept in an overlay which takes precedence over the arrays, and are merged
+  into the arrays by :func compact:.
+  """
+
+  # The kinds of dependencies, as bits of the kind mask of a dependency.
+  KIND_BITS = {'uses': 1, 'implements': 2}
 
-      # Never consider self-dependency.
-      module_dependencies.discard(module)
+  # The number of changes that can be kept in the overlay (or, if larger, the
+  # number of dependencies in the arrays) before the map is automatically
+  # compacted.
+  COMPACTION_THRESHOLD = 65536
+
+  def __init__(self, module_mapping):
+    super().__init__(module_mapping)
 
-      for dependency in module_dependencies:
-        self._module_mapping.add_module_import(module, dependency)
+    self._offsets = array('q', [0])
+    self._targets = array('q')
+    self._kinds = array('B')
 
+    self._r_offsets = array('q', [0])
+    self._r_sources = array('q')
+    self._r_kinds = array('B')
+
+    # Rows changed since the last compaction, in the format of
+    # file -> {dependency file: kind mask}. (Rows might be empty here, in
+    # which case they hide the row stored in the arrays.)
+    self._overlay = dict()
+
+    # The reverse of the overlay, in the format of
+    # file -> {dependee file: kind mask}, for the dependees in the overlay.
+    self._r_overlay = dict()
+    self._pending_changes = 0
+
+  def __getstate__(self):
+    # Only send the arrays, and not the overlay, to other processes.
+    self.compact()
+    return self.__dict__
+
+  def __contains__(self, item):
+    """
+    Returns if a dependency is known for the given file, or module.
+    """
+    module_id = self._module_mapping._find_module_id(item)
+    if module_id is not None:
+      return any(any(True for _ in self._row(file_id))
+                 for file_id in
+                 self._module_mapping._get_fragment_ids(module_id))
+
+    file_id = self._catalog.find_id(item)
+    if file_id is None:
+      return False
+    return any(True for _ in self._row(file_id)) or \
+      bool(self._reverse_row(file_id))
 
-def get_module_mapping(srcdir):
+  def _kinds_of_mask(self, mask):
+    return [kind for kind, bit in self.KIND_BITS.items() if mask & bit]
+
+  def _row(self, file_id):
+    """
+    :return: The (dependency, kind mask) pairs of the dependencies of
+    :param file_id:.
+    """
+    row = self._overlay.get(file_id, None)
+    if row is not None:
+      return row.items()
+    if file_id + 1 >= len(self._offsets):
+      return ()
+
+    begin, end = self._offsets[file_id], self._offsets[file_id + 1]
+    return zip(self._targets[begin:end], self._kinds[begin:end])
+
+  def _reverse_row(self, file_id):
+    """
+    :return: A dependee -> kind mask dict of the files depending on
+    :param file_id:.
+    """
+    ret = dict(self._r_overlay.get(file_id, dict()))
+    if file_id + 1 < len(self._r_offsets):
+      begin, end = self._r_offsets[file_id], self._r_offsets[file_id + 1]
+      for dependee, mask in zip(self._r_sources[begin:end],
+                                self._r_kinds[begin:end]):
+        # Rows in the overlay are indexed by the reverse overlay.
+        if dependee not in self._overlay:
+          ret[dependee] = mask
+
+    return ret
+
+  def _get_mask(self, dependee, dependency):
+    row = self._overlay.get(dependee, None)
+    if row is not None:
+      return row.get(dependency, 0)
+    if dependee + 1 >= len(self._offsets):
+      return 0
+
+    end = self._offsets[dependee + 1]
+    idx = bisect_left(self._targets, dependency, self._offsets[dependee], end)
+    if idx < end and self._targets[idx] == dependency:
+      return self._kinds[idx]
+    return 0
+
+  def _set_mask(self, dependee, dependency, mask):
+    row = self._overlay.get(dependee, None)
+    if row is None:
+      # Copy the row into the overlay before changing it.
+      row = dict(self._row(dependee))
+      self._overlay[dependee] = row
+      for row_dependency, row_mask in row.items():
+        self._r_overlay.setdefault(row_dependency, dict())[dependee] = \
+          row_mask
+      self._pending_changes += len(row)
+
+    reverse_row = self._r_overlay.setdefault(dependency, dict())
+    if mask:
+      row[dependency] = mask
+      reverse_row[dependee] = mask
+    else:
+      row.pop(dependency, None)
+      reverse_row.pop(dependee, None)
+      if not reverse_row:
+        del self._r_overlay[dependency]
+
+    self._pending_changes += 1
+    if self._pending_changes > max(self.COMPACTION_THRESHOLD,
+                                   len(self._targets)):
+      self.compact()
+
+  def compact(self):
+    """
+    Merge the changes in the overlay into the arrays.
+    """
+    if not self._overlay:
+      return
+
+    file_count = max(len(self._catalog), len(self._offsets) - 1)
+    offsets = array('q', [0])
+    targets = array('q')
+    kinds = array('B')
+    for file_id in range(file_count):
+      for dependency, mask in sorted(self._row(file_id)):
+        targets.append(dependency)
+        kinds.append(mask)
+      offsets.append(len(targets))
+
+    # Create the reverse arrays with a counting sort on the dependencies.
+    r_offsets = array('q', [0]) * (file_count + 1)
+    for dependency in targets:
+      r_offsets[dependency + 1] += 1
+    for file_id in range(file_count):
+      r_offsets[file_id + 1] += r_offsets[file_id]
+
+    r_sources = array('q', [0]) * len(targets)
+    r_kinds = array('B', [0]) * len(targets)
+    cursor = array('q', r_offsets)
+    for dependee in range(file_count):
+      for idx in range(offsets[dependee], offsets[dependee + 1]):
+        dependency = targets[idx]
+        r_sources[cursor[dependency]] = dependee
+        r_kinds[cursor[dependency]] = kinds[idx]
+        cursor[dependency] += 1
+
+    self._offsets, self._targets, self._kinds = offsets, targets, kinds
+    self._r_offsets, self._r_sources, self._r_kinds = \
+      r_offsets, r_sources, r_kinds
+    self._overlay = dict()
+    self._r_overlay = dict()
+    self._pending_changes = 0
+
+  def add_dependency(self, dependee, dependency, kind="uses"):
+    """
+    Add the dependency that :param dependee: depends on :param dependency:.
+
+    :param kind: should be `uses` or `implements`.
+    """
+    if kind not in ['uses', 'implements']:
+      raise ValueError("'kind' should be either 'uses' or 'implements'.")
+
+    dependee_id = self._catalog.find_id(dependee)
+    dependency_id = self._catalog.find_id(dependency)
+    dependee_modules = list(
+      self._module_mapping._get_modules_for_id(dependee_id))
+    dependency_modules = list(
+      self._module_mapping._get_modules_for_id(dependency_id))
+
+    if not dependee_modules:
+      raise ValueError("Cannot add dependency of '%s' because it is not "
+                       "assigned to any module." % dependee)
+    if not dependency_modules:
+      raise ValueError("Cannot add dependency for '%s' because it is not "
+                       "assigned to any module." % dependency)
+
+    mask = self._get_mask(dependee_id, dependency_id)
+    if mask & self.KIND_BITS[kind]:
+      return
+
+    self._set_mask(dependee_id, dependency_id, mask | self.KIND_BITS[kind])
+    self._link(dependee_id, dependee_modules,
+               dependency_id, dependency_modules,
+               kind)
+
+  def _link(self, dependee, dependee_modules,
+            dependency, dependency_modules,
+            kind):
+    # The file-level dependencies are stored in the arrays and the overlay,
+    # only the module-level indexes have to be kept up to date.
+    for module in dependee_modules:
+      if kind == 'implements':
+        self._add_implementation(module, dependee, dependency)
+        continue
+
+      for dependency_module in dependency_modules:
+        self._count_module_use(module, dependency_module, 1)
+
+  def _unlink(self, dependee, dependee_modules,
+              dependency, dependency_modules,
+              kind):
+    for module in dependee_modules:
+      if kind == 'implements':
+        self._discard_implementation(module, dependee, dependency)
+        continue
+
+      for dependency_module in dependency_modules:
+        self._count_module_use(module, dependency_module, -1)
+
+  def remove_file(self, filename):
+    """
+    Removes the given :param filename: from the dependency map. Every
+    depedency incident to the file is removed.
+    """
+    file_id = self._catalog.find_id(filename)
+    if file_id is None:
+      return
+    file_modules = list(self._module_mapping._get_modules_for_id(file_id))
+
+    for dependency, mask in list(self._row(file_id)):
+      self._set_mask(file_id, dependency, 0)
+      for kind in self._kinds_of_mask(mask):
+        self._unlink(
+          file_id,
+          file_modules,
+          dependency,
+          list(self._module_mapping._get_modules_for_id(dependency)),
+          kind)
+
+    for dependee, mask in self._reverse_row(file_id).items():
+      self._set_mask(dependee, file_id, 0)
+      for kind in self._kinds_of_mask(mask):
+        self._unlink(
+          dependee,
+          list(self._module_mapping._get_modules_for_id(dependee)),
+          file_id,
+          file_modules,
+          kind)
+
+  def _get_incident_dependencies(self, file_ids):
+    ret = set()
+    for file_id in file_ids:
+      for dependency, mask in self._row(file_id):
+        ret.update((file_id, dependency, kind)
+                   for kind in self._kinds_of_mask(mask))
+      for dependee, mask in self._reverse_row(file_id).items():
+        ret.update((dependee, file_id, kind)
+                   for kind in self._kinds_of_mask(mask))
+
+    return ret
+
+  def get_dependencies(self, filename):
+    """
+    :return: A collection of files :param filename: depends on, across every
+    module.
+    """
+    ret = {'uses': set(), 'implements': set()}
+    file_id = self._catalog.find_id(filename)
+    if file_id is None:
+      return ret
+
+    for dependency, mask in self._row(file_id):
+      for kind in self._kinds_of_mask(mask):
+        ret[kind].add(self._catalog.get_path(dependency))
+    return ret
+
+  def get_dependees(self, filename):
+    """
+    :return: A collection of files depending on :param filename:, across every
+    module.
+    """
+    file_id = self._catalog.find_id(filename)
+    if file_id is None:
+      return set()
+
+    ret = set()
+    for dependee, mask in self._reverse_row(file_id).items():
+      for kind in self._kinds_of_mask(mask):
+        ret.add((self._catalog.get_path(dependee), kind))
+    return ret
+
+  def get_files_creating_dependency_between(self, from_module, to_module):
+    """
+    Retrieve the list of files that are the reason that :param from_module:
+    depends on :param to_module:.
+
+    :return: A dictionary object containing a filename => set of
+    (filenames, kind) mapping.
+    """
+    from_module = self._module_mapping._find_module_id(from_module)
+    to_module = self._module_mapping._find_module_id(to_module)
+    if from_module is None or to_module is None:
+      return dict()
+
+    ret = dict()
+    for from_file in self._module_mapping._get_fragment_ids(from_module):
+      to_files = set()
+      for to_file, mask in self._row(from_file):
+        if to_module not in \
+              self._module_mapping._get_modules_for_id(to_file):
+          continue
+
+        to_path = self._catalog.get_path(to_file)
+        to_files.update((to_path, kind)
+                        for kind in self._kinds_of_mask(mask))
+
+      if to_files:
+        ret[self._catalog.get_path(from_file)] = to_files
+    return ret
+
+
+def _read_module_file(srcdir, file):
   """
-  Reads up the given :param srcdir: directory and create a mapping of which
-  source file (as a module fragment) is mapped into which module.
+  Parse the module file :param file: (relative to :param srcdir:).
+
+  :return: The name of the module (or None if the file is bogus), the list of
+  fragments included into it, and the list of (log function, message) errors
+  to be reported by the caller.
   """
-  mapping = ModuleMapping()
+  with open(os.path.join(srcdir, file), 'r') as f:
+    lines = f.readlines()
 
-  # Read the files and create the mapping.
-  file_list = list(walk_folder(srcdir))
-  for file in tqdm(file_list,
-                   desc="Searching for module files...",
-                   unit='file'):
-    if not file.endswith('cppm'):
+  # Find the module's "inner name" from the 'export module' statement.
+  module_name = None
+  for line in lines:
+    if not line.startswith('export module'):
       continue
 
-    with open(file, 'r') as f:
-      # Find the module's "inner name" from the 'export module' statement.
-      module_name = None
-      for line in f.readlines():
-        if not line.startswith('export module'):
-          continue
+    line = line.replace('export module ', '')
+    match = MODULE_MACRO.match(line)
+    if not match:
+      return None, [], [(logging.essential,
+                         "Error! Cannot read input file '%s' because "
+                         "'export module' line is badly formatted.\n%s"
+                         % (file, line))]
+    module_name = match.group('name')
+    break
+
+  if not module_name:
+    # Skip parsing the file if it was bogus.
+    return None, [], []
+
+  fragments, errors = list(), list()
+  for line in lines:
+    included = include.directive_to_filename(line)
+    if not included:
+      continue
+
+    # TODO: Handle include paths here.
+    included_local = os.path.join(os.path.dirname(file), included)
+    if not os.path.isfile(os.path.join(srcdir, included_local)):
+      errors.append((logging.normal,
+                     "Error: '%s' includes '%s' but that file could not be "
+                     "found." % (file, included_local)))
+      continue
+
+    fragments.append(strip_folder(srcdir,
+                                  os.path.join(srcdir, included_local)))
+
+  return module_name, fragments, errors
 
-        line = line.replace('export module ', '')
-        match = MODULE_MACRO.match(line)
-        if not match:
-          logging.essential("Error! Cannot read input file '%s' because "
-                            "'export module' line is badly formatted.\n%s"
-                            % (file, line),
-                            file=sys.stderr)
-          break
-        module_name = match.group('name')
-        break
 
+def _thread_pool(thread_count, pool):
+  """
+  :return: A context manager for the given thread :param pool:, or if it is
+  None, for a new thread pool with :param thread_count: threads, which is
+  stopped at the end of the context.
+  """
+  return ThreadPool(thread_count) if pool is None else nullcontext(pool)
+
+
+def get_module_mapping(srcdir, catalog=None, excluded_directories=None,
+                       use_gitignore=True, thread_count=None, pool=None):
+  """
+  Reads up the given :param srcdir: directory and create a mapping of which
+  source file (as a module fragment) is mapped into which module.
+
+  The module files are searched by :func utils.discovery.find_files: with
+  :param excluded_directories: and :param use_gitignore:, and are parsed on
+  :param thread_count: threads (or on the thread :param pool:, if given).
+  The files are identified in the given :param catalog:, or in a new one if
+  no catalog is given.
+  """
+  if catalog is None:
+    catalog = FileCatalog(srcdir)
+  mapping = ModuleMapping(catalog)
+
+  # Read the files and create the mapping.
+  file_list = list(discovery.find_files(srcdir, '.cppm',
+                                        excluded_directories,
+                                        use_gitignore))
+  with _thread_pool(thread_count, pool) as pool:
+    results = pool.imap(partial(_read_module_file, srcdir), file_list)
+    for result, file in zip(tqdm(results,
+                                 desc="Searching for module files...",
+                                 total=len(file_list),
+                                 unit='file'),
+                            file_list):
+      module_name, fragments, errors = result
+      for log, message in errors:
+        log(message, file=sys.stderr)
       if not module_name:
-        # Skip parsing the file if it was bogus.
         continue
 
       mapping.add_module(module_name, file)
-      f.seek(0)
-      for line in f.readlines():
-        included = include.directive_to_filename(line)
-        if not included:
-          continue
-
-        # TODO: Handle include paths here.
-        included_local = os.path.join(os.path.dirname(file), included)
-        if not os.path.isfile(included_local):
-          logging.normal("Error: '%s' includes '%s' but that file could not "
-                         "be found." % (file, included_local),
-                         file=sys.stderr)
-          continue
-
-        mapping.add_fragment(module_name,
-                             strip_folder(srcdir, included_local))
+      for fragment in fragments:
+        mapping.add_fragment(module_name, fragment)
 
   # Check for files that are (perhaps accidentally) included in multiple module
   # files.
   duplicated = list()
   counts = Counter(mapping.get_all_fragments())
   for module in mapping:
-    fragments = mapping.get_fragment_list(module)
-    for file in filter(lambda x: counts[x] != 1, fragments):
-      duplicated.append(file)
-      fragments.remove(file)
+    duplicated.extend(filter(lambda x: counts[x] != 1,
+                             mapping.get_fragment_list(module)))
+  for file in set(duplicated):
+    mapping.remove_fragment(file, remove_empty_modules=False)
 
   mapping.set_not_tainted()
   return mapping, duplicated
 
 
-def write_module_mapping(srcdir, module_map):
+def _render_module_file(module, backing_file, dependencies, fragments,
+                        srcdir):
+  """
+  :return: The contents of the module file of :param module:, to be written
+  to :param backing_file:.
+  """
+  lines = list(map(substitute_module_import, sorted(dependencies)))
+  lines.extend(['\n', substitute_module_macro(module), '\n', '\n'])
+
+  for frag in fragments:
+    frag = os.path.join(srcdir, frag)
+    frag = strip_folder(os.path.dirname(backing_file), frag)
+
+    lines.append(include.filename_to_directive(frag))
+    lines.append('\n')
+
+  return ''.join(lines)
+
+
+def write_module_mapping(srcdir, module_map, thread_count=None, pool=None):
   """
   Write the given :param module_map: into the :param srcdir: directory as
   C++ Modules-TS module files.
-  """
-  old_folder = os.getcwd()
-  os.chdir(srcdir)
 
+  Only the files whose contents change are written, on :param thread_count:
+  threads (or on the thread :param pool:, if given), so the unchanged module
+  files keep their modification time.
+  """
   modules_to_delete = list()
+  files_to_write = list()
   for module in tqdm(sorted(module_map),
-                     desc="Writing new modules",
+                     desc="Rendering new modules",
                      total=len(module_map),
                      unit='module'):
     if not module_map.is_tainted(module):
@@ -464,66 +1493,49 @@ def write_module_mapping(srcdir, module_map):
     if not fragments:
       modules_to_delete.append(module)
       if backing_file != MEMORY_ONLY_MODULE_BACKING_FILENAME:
-        os.unlink(backing_file)
+        os.unlink(os.path.join(srcdir, backing_file))
       continue
 
     if backing_file == MEMORY_ONLY_MODULE_BACKING_FILENAME:
       backing_file = os.path.join(srcdir, module + '.cppm')
       module_map.set_backing_file(module, backing_file)
 
-    with open(backing_file, 'w') as f:
-      for module_dependency in sorted(
-            module_map.get_dependencies_of_module(module)):
-        f.write(substitute_module_import(module_dependency))
+    backing_file = os.path.join(srcdir, backing_file)
+    files_to_write.append(
+      (backing_file,
+       _render_module_file(module,
+                           backing_file,
+                           module_map.get_dependencies_of_module(module),
+                           fragments,
+                           srcdir)))
 
-      f.writelines(['\n', substitute_module_macro(module), '\n', '\n'])
-
-      for frag in fragments:
-        frag = os.path.join(srcdir, frag)
-        frag = strip_folder(os.path.dirname(backing_file), frag)
-
-        f.write(include.filename_to_directive(frag))
-        f.write('\n')
+  with _thread_pool(thread_count, pool) as pool:
+    written = pool.starmap(write_file_if_changed, files_to_write)
+  logging.verbose("Wrote %d module files, %d were unchanged."
+                  % (written.count(True), written.count(False)))
 
   for module_to_delete in modules_to_delete:
     del module_map[module_to_delete]
 
   module_map.set_not_tainted()
 
-  os.chdir(old_folder)
-
 
 def apply_file_moves(module_map, dependency_map, moved_files):
   """
   Update :param ModuleMapping: and :type DependencyMap: by applying the file
   moving to other module changes dictated by :param moved_files:.
+
+  The moves are applied in bulk, and in case of an error, the maps are left
+  untouched. (See :func DependencyMap.move_files:.)
   """
   if not moved_files:
     return
 
-  dependencies_to_fix_up = list()
-  for filename in moved_files:
-    for file_depending_on_moved, dep_kind in \
-          dependency_map.get_dependees(filename):
-      dependencies_to_fix_up.append(
-        (file_depending_on_moved, filename, dep_kind))
-    for dep_kind, files in dependency_map.get_dependencies(filename).items():
-      for moved_depending_on_file in files:
-        dependencies_to_fix_up.append(
-          (filename, moved_depending_on_file, dep_kind))
-
-    dependency_map.remove_file(filename)
-
-  for filename, new_module in moved_files.items():
-    module_map.remove_fragment(filename)
-    if new_module not in module_map:
-      module_map.add_module(new_module, MEMORY_ONLY_MODULE_BACKING_FILENAME)
-    module_map.add_fragment(new_module, filename)
-
-  for dependee, dependency, kind in dependencies_to_fix_up:
-    # Fix the dependency map so the file->file dependencies now point through
-    # the new module names.
-    dependency_map.add_dependency(dependee, dependency, kind)
+  if module_map is not dependency_map.get_module_map():
+    raise ValueError("The dependency map is not bound to the given module "
+                     "map.")
+
+  dependency_map.move_files(moved_files)
 
   # Resynthesize the import list because file-module relations have changed.
   dependency_map.synthesize_intermodule_imports()
@@ -569,23 +1581,60 @@ def fix_module_names(module_map, dependency_map):
   Modules are generated an automatic name when created by the tool, but
   these names can shift as files are moved from an autogenerated module to
   another one. This function automatically fixes these names.
+
+  Only the modules whose fragments changed since their name was last fixed
+  are considered. The modules are renamed in place, which does not affect
+  :param dependency_map:, as it refers to modules by their ID.
   """
+  if module_map is not dependency_map.get_module_map():
+    raise ValueError("The dependency map is not bound to the given module "
+                     "map.")
 
-  files_to_move_for_fixup = dict()
   for module in module_map:
-    if module_map.get_filename(module) == MEMORY_ONLY_MODULE_BACKING_FILENAME:
+    if module_map.get_filename(module) != MEMORY_ONLY_MODULE_BACKING_FILENAME:
       # (Only change for modules that are not original inputs from the disk.)
-      files_in_module = sorted(module_map.get_fragment_list(module))
-      new_module_name = get_new_module_name(module_map, files_in_module,
-                                            accepted_name=module)
+      continue
+    if module_map._is_name_fixed(module):
+      continue
 
-      if new_module_name == module:
-        continue
-      # Create the dict element key-value pairs for the file -> new module
-      # mapping.
-      files_to_move_for_fixup.update(map(lambda f: (f, new_module_name),
-                                         files_in_module))
-  apply_file_moves(module_map, dependency_map, files_to_move_for_fixup)
+    files_in_module = sorted(module_map.get_fragment_list(module))
+    new_module_name = get_new_module_name(module_map, files_in_module,
+                                          accepted_name=module)
+    if new_module_name != module:
+      module_map.rename_module(module, new_module_name)
+    module_map._set_name_fixed(new_module_name)
+
+
+def get_module_include_projections(external_include_graph, module_map):
+  """
+  Calculate, for every module of :param module_map:, the projection of the
+  :param external_include_graph: that is relevant for sorting the files of
+  the module: the module's own files, and the external files reachable from
+  them (through external files and files of the same module).
+
+  The projections are calculated once, so that the project-wide graph need
+  not be copied and pruned for every module.
+
+  :return: A dict, mapping module names to the set of nodes of the graph in
+  the projection.
+  """
+  projections = dict()
+  for module in module_map:
+    files = set(f for f in module_map.get_fragment_list(module)
+                if f in external_include_graph)
+    nodes = set(files)
+    work_list = list(files)
+    while work_list:
+      for included in external_include_graph.successors(work_list.pop()):
+        if included in nodes:
+          continue
+        if included in files or \
+              external_include_graph.nodes[included].get('external', False):
+          nodes.add(included)
+          work_list.append(included)
+    projections[module] = nodes
+
+  return projections
 
 
 def clean_cycles_from_external_graph(external_include_graph):
@@ -600,13 +1649,27 @@ def clean_cycles_from_external_graph(external_include_graph):
   a cycle, and these files are only used to sorting the "module-internal"
   files.
 
-  :return: None. The graph is modified in place.
+  The cycles are found through the strongly connected components of the graph.
+  While a component has an internal file, an include edge into an internal
+  file of the component (preferably one from an external file) is cut, and the
+  component is recalculated.
+
+  :return: The set of (u, v) edges that must be removed from the graph to
+  break the cycles. The graph itself is not modified.
   """
+  edges_to_remove = set()
   module_attr = nx.get_node_attributes(external_include_graph, 'modules')
-  for c in nx.simple_cycles(external_include_graph):
-    internals_in_cycle = list(v for v in c if module_attr[v])
+  # (The view always reflects the edges cut so far.)
+  graph = nx.subgraph_view(
+    external_include_graph,
+    filter_edge=lambda u, v: (u, v) not in edges_to_remove)
+
+  work_list = list(cyclic_components(graph))
+  while work_list:
+    component = work_list.pop()
+    internals_in_cycle = sorted(v for v in component if module_attr[v])
     if not internals_in_cycle:
-      # If the cycle contains no internal files it can safely be ignored.
+      # If the cycles contain no internal files they can safely be ignored.
       continue
 
     try:
@@ -614,20 +1677,27 @@ def clean_cycles_from_external_graph(external_include_graph):
       if len(modules_in_cycle) != 1:
         raise ValueError("A cycle (%s) is between multiple modules (%s), and "
                          "thus cannot be fixed."
-                         % (', '.join(c), ', '.join(modules_in_cycle)))
+                         % (', '.join(sorted(component)),
+                            ', '.join(sorted(modules_in_cycle))))
     except IndexError:
       raise NotImplementedError("An internal file in the cycle '%s' does not "
-                                "belong to a module?" % ', '.join(c))
+                                "belong to a module?"
+                                % ', '.join(sorted(component)))
 
-    idx_of_last_internal = c.index(internals_in_cycle[-1])
-    last_edge = (c[idx_of_last_internal - 1], c[idx_of_last_internal])
-    external_include_graph.remove_edge(*last_edge)
+    edge = min(((u, v) for v in internals_in_cycle
+                for u in graph.predecessors(v) if u in component),
+               key=lambda e: (bool(module_attr[e[0]]), e))
+    edges_to_remove.add(edge)
+    work_list.extend(cyclic_components(graph.subgraph(component)))
+
+  return edges_to_remove
 
 
 def write_topological_order(module_file,
                             regex,
                             external_include_graph,
-                            intramodule_dependencies):
+                            intramodule_dependencies,
+                            external_nodes=None):
   """
   Calculate and write topological ordering of files based on the built
   intra-dependency map. This ensures that file "fragments" included into
@@ -644,6 +1714,11 @@ def write_topological_order(module_file,
   :param external_include_graph: This graph contains file->file dependencies
   in order of an (u, v) edge specifying that file u depends on file v.
 
+  :param external_nodes: The nodes of :param external_include_graph: that are
+  relevant for the module, as calculated by
+  :func get_module_include_projections:. If not given, every node of the graph
+  is considered.
+
   :return: True if a topological sort was successfully created, otherwise the
   list of files for which "header guards" must remain because they could not
   have been topo-sorted correctly.
@@ -657,14 +1732,22 @@ def write_topological_order(module_file,
   # is required because of this.
   graph = nx.DiGraph(intramodule_dependencies).reverse(True)
 
+  def _is_external(v):
+    return v in external_include_graph and \
+      external_include_graph.nodes[v].get('external', False)
+
   # Add the external dependency edges between files of the current module
-  # only, and of course keep the "external" files.
-  extern_sub_graph = external_include_graph.copy()
-  external_attribute = nx.get_node_attributes(extern_sub_graph, 'external')
-  extern_sub_graph.remove_nodes_from([
-    v for v in extern_sub_graph
-    if external_attribute[v] is False and v not in graph.nodes])
-  clean_cycles_from_external_graph(extern_sub_graph)
+  # only, and of course keep the "external" files. (The project-wide graph is
+  # not copied, only a view of it is used.)
+  if external_nodes is None:
+    external_nodes = external_include_graph.nodes
+  extern_sub_graph = external_include_graph.subgraph(
+    [v for v in external_nodes if _is_external(v) or v in graph])
+  edges_to_remove = clean_cycles_from_external_graph(extern_sub_graph)
+  if edges_to_remove:
+    extern_sub_graph = nx.subgraph_view(
+      extern_sub_graph,
+      filter_edge=nx.filters.hide_diedges(edges_to_remove))
 
   # Reverse the edges for the exact same reason as above.
   graph.update(extern_sub_graph.reverse(False))
@@ -675,8 +1758,8 @@ def write_topological_order(module_file,
   # observing symbol-to-symbol dependencies within the file, which we do not
   # do...) directives.
   files_in_cycles = set()
-  cycles = list(nx.simple_cycles(graph))
-  if cycles:
+  components = list(cyclic_components(graph))
+  if components:
     logging.essential("Warning! Circular dependency found in header files "
                       "used in module %s. Module file cannot be rewritten "
                       "to lack header guards!"
@@ -684,10 +1767,17 @@ def write_topological_order(module_file,
                       file=sys.stderr)
 
     logging.normal("The following cycles were detected:", file=sys.stderr)
-    for cycle in cycles:
-        logging.normal("\t%s -> %s" % (" -> ".join(cycle), cycle[0]),
-                       file=sys.stderr)
-        files_in_cycles.update(cycle)
+    for component in components[:CYCLE_SAMPLE_LIMIT]:
+      cycle = sample_cycle(graph, component)
+      logging.normal("\t%s -> %s" % (" -> ".join(cycle), cycle[0]),
+                     file=sys.stderr)
+    if len(components) > CYCLE_SAMPLE_LIMIT:
+      logging.normal("\t... and cycles in %d more groups of files."
+                     % (len(components) - CYCLE_SAMPLE_LIMIT),
+                     file=sys.stderr)
+
+    for component in components:
+      files_in_cycles.update(component)
 
   for file in files_in_cycles:
     graph.remove_node(file)
@@ -695,7 +1785,7 @@ def write_topological_order(module_file,
   topological = list(nx.topological_sort(graph))  # Force generation for exc.
   topological.extend(files_in_cycles)
 
-  with codecs.open(module_file, 'r+',
+  with codecs.open(module_file, 'r',
                    encoding='utf-8', errors='replace') as f:
     lines = f.readlines()
 
@@ -725,7 +1815,7 @@ def write_topological_order(module_file,
     # Rewrite matching lines to the topological order of files.
     new_includes = []
     for file in topological:
-      if external_attribute.get(file, False):
+      if _is_external(file):
         continue
 
       # Modules usually include files relative to the module file's own
@@ -738,9 +1828,8 @@ def write_topological_order(module_file,
             new_includes + \
             lines_to_keep
 
-    f.seek(0)
-    f.writelines(lines)
-    f.truncate(f.tell())
+  # (Do not touch the file if the order did not change.)
+  write_file_if_changed(module_file, ''.join(lines))
 
   return True if not files_in_cycles else list(files_in_cycles)
 
@@ -756,33 +1845,7 @@ def get_dependency_map_implementation_insanity(dependency_map):
   A dependency map is implementation-sane if every file that is implemented is
   only implemented by files in at most a single module.
 
-  :note: This operation is costly to calculate as it involves a reverse mapping
-  and should not be called too many times.
+  :note: The dependency map keeps an index of the implementing modules, so
+  this check is linear in the number of implemented files.
   """
-  file_implemented_in_module = dict()
-  for file in dependency_map.get_module_map().get_all_fragments():
-    file_implementees = dict()
-
-    for dependee_tuple in dependency_map.get_dependees(file):
-      dependee, kind = dependee_tuple
-      if kind != 'implements':
-        continue
-
-      dependee_modules = dependency_map \
-        .get_module_map() \
-        .get_modules_for_fragment(dependee)
-      for implementing_module in dependee_modules:
-        implementees_in_module = file_implementees.get(implementing_module,
-                                                       set())
-        if not implementees_in_module:
-          file_implementees[implementing_module] = implementees_in_module
-        implementees_in_module.add(dependee)
-
-    if file_implementees:
-      file_implemented_in_module[file] = file_implementees
-
-  # Filter the implements relations to only the files that are not sane.
-  insane_implements_relations = dict(
-    filter(lambda e: len(e[1]) > 1, file_implemented_in_module.items()))
-
-  return insane_implements_relations
+  return dependency_map.get_implementation_insanity()
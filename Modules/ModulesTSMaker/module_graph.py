@@ -0,0 +1,217 @@
+try:
+  import networkx as nx
+except ImportError as e:
+  print("Error! A dependency of this tool could not be satisfied. Please "
+        "install the following Python package via 'pip' either to the "
+        "system, or preferably create a virtualenv.")
+  raise
+
+from utils.graph import merge_shortest_cycles, shortest_cycles_in_component
+
+
+class ModuleGraph():
+  """
+  A module graph is a persistent graph of the imports between the modules of
+  a :type ModuleMapping:. The graph observes the mapping, and receives the
+  import changes (e.g. the ones caused by moving files between modules) as
+  they happen.
+
+  The strongly connected components of the graph, and the shortest cycles
+  inside them, are kept up to date incrementally: only the components that
+  were affected by the changes since the previous query are recalculated.
+
+  The modules are stored by their ID in the mapping, and the cycles are
+  calculated with the names the modules have at the time of the calculation.
+  (Renaming a module drops the cycles of its component, as the names decide
+  the order in which the cycles are searched.)
+
+  >>> from ModulesTSMaker.mapping import ModuleMapping
+  >>> modules = ModuleMapping()
+  >>> for module in 'ABCD':
+  ...   modules.add_module(module, module + '.cppm')
+  >>> for module, dependency in ['AB', 'BC', 'CA', 'CD']:
+  ...   modules.add_module_import(module, dependency)
+  >>> module_graph = ModuleGraph(modules)
+  >>> [sorted(c) for c in module_graph.get_strongly_connected_components()]
+  [['A', 'B', 'C']]
+  >>> module_graph.get_shortest_cycles()[1][0]
+  ('A', ['A', 'B', 'C', 'A'])
+
+  >>> modules.add_module_import('B', 'A')
+  >>> module_graph.get_shortest_cycles()
+  (3, [('A', ['A', 'B', 'A']), ('B', ['B', 'A', 'B'])])
+  >>> modules.remove_module_import('C', 'A')
+  >>> [sorted(c) for c in module_graph.get_strongly_connected_components()]
+  [['A', 'B']]
+
+  >>> modules.rename_module('A', 'Z')
+  >>> module_graph.get_shortest_cycles()
+  (3, [('B', ['B', 'Z', 'B']), ('Z', ['Z', 'B', 'Z'])])
+  >>> modules.remove_module_import('B', 'Z')
+  >>> module_graph.get_shortest_cycles()
+  (0, [])
+  """
+  def __init__(self, module_map):
+    self._module_map = module_map
+
+    # module -> set(imported modules), and the reverse.
+    self._successors = dict()
+    self._predecessors = dict()
+
+    # The non-trivial strongly connected components, and the component of
+    # every module that is in one.
+    self._components = set()
+    self._component_of = dict()
+
+    # Cache of the shortest cycles in the components, in the format of
+    # :func utils.graph.shortest_cycles_in_component:.
+    self._cycles = dict()
+
+    # The changes not yet reflected in the components.
+    self._changed_components = set()
+    self._added_edges = list()
+
+    for module in module_map:
+      module_id = module_map._find_module_id(module)
+      for dependency_id in module_map._get_entry(module)['imported-modules']:
+        self._add_edge(module_id, dependency_id)
+    self._added_edges = list()
+
+    for component in nx.strongly_connected_components(
+          nx.DiGraph(self._successors)):
+      if len(component) > 1:
+        self._set_component(frozenset(component))
+
+    module_map.add_import_observer(self._import_changed)
+    module_map.add_rename_observer(self._module_renamed)
+
+  def detach(self):
+    """
+    Stop observing the module mapping. The graph is not updated anymore.
+    """
+    self._module_map.remove_import_observer(self._import_changed)
+    self._module_map.remove_rename_observer(self._module_renamed)
+
+  def _add_edge(self, module_id, dependency_id):
+    self._successors.setdefault(module_id, set()).add(dependency_id)
+    self._predecessors.setdefault(dependency_id, set()).add(module_id)
+    self._added_edges.append((module_id, dependency_id))
+
+  def _import_changed(self, module_id, dependency_id, added):
+    if added:
+      if dependency_id not in self._successors.get(module_id, ()):
+        self._add_edge(module_id, dependency_id)
+      return
+
+    successors = self._successors.get(module_id, set())
+    if dependency_id not in successors:
+      return
+    successors.remove(dependency_id)
+    self._predecessors[dependency_id].discard(module_id)
+
+    # Removing an edge can only split the component which contained it.
+    component = self._component_of.get(module_id, None)
+    if component is not None and \
+          component is self._component_of.get(dependency_id, None):
+      self._changed_components.add(component)
+
+  def _module_renamed(self, module_id):
+    component = self._component_of.get(module_id, None)
+    if component is not None:
+      self._cycles.pop(component, None)
+
+  def _set_component(self, component):
+    self._components.add(component)
+    for module_id in component:
+      self._component_of[module_id] = component
+
+  def _unset_component(self, component):
+    self._components.discard(component)
+    self._cycles.pop(component, None)
+    for module_id in component:
+      if self._component_of.get(module_id, None) is component:
+        del self._component_of[module_id]
+
+  def _reachable(self, start, adjacency, allowed=None):
+    """
+    :return: The nodes reachable from :param start: (including it) in the
+    :param adjacency: index, only visiting the nodes in :param allowed:.
+    """
+    reached = {start}
+    work_list = [start]
+    while work_list:
+      for node in adjacency.get(work_list.pop(), ()):
+        if node not in reached and (allowed is None or node in allowed):
+          reached.add(node)
+          work_list.append(node)
+    return reached
+
+  def _update_components(self):
+    # Split the components that lost an edge inside them, based on the
+    # current edges between their modules.
+    for component in self._changed_components:
+      self._unset_component(component)
+      subgraph = nx.DiGraph()
+      subgraph.add_nodes_from(component)
+      subgraph.add_edges_from(
+        (u, v) for u in component for v in self._successors.get(u, ())
+        if v in component)
+      for new_component in nx.strongly_connected_components(subgraph):
+        if len(new_component) > 1:
+          self._set_component(frozenset(new_component))
+    self._changed_components = set()
+
+    # An added edge u -> v merges every module that is reachable from v and
+    # from which u is reachable into one component.
+    for u, v in self._added_edges:
+      if v not in self._successors.get(u, ()):
+        # (The edge has been removed since.)
+        continue
+
+      component = self._component_of.get(u, None)
+      if component is not None and component is self._component_of.get(v):
+        # The component did not change, but its cycles might have.
+        self._cycles.pop(component, None)
+        continue
+
+      forward = self._reachable(v, self._successors)
+      if u not in forward:
+        continue
+      merged = self._reachable(u, self._predecessors, forward)
+      for module_id in merged:
+        component = self._component_of.get(module_id, None)
+        if component is not None:
+          self._unset_component(component)
+      self._set_component(frozenset(merged))
+    self._added_edges = list()
+
+  def get_strongly_connected_components(self):
+    """
+    :return: The list of the non-trivial strongly connected components of the
+    graph, as sets of module names.
+    """
+    self._update_components()
+    names = self._module_map._get_module_name
+    return [set(map(names, component)) for component in self._components]
+
+  def get_shortest_cycles(self):
+    """
+    Calculate the shortest cycles between the modules, in the format of
+    :func utils.graph.simple_cycles:. Only the cycles of the components that
+    changed since the previous call are recalculated.
+    """
+    self._update_components()
+    names = self._module_map._get_module_name
+    ids = self._module_map._get_module_id
+
+    results = list()
+    for component in self._components:
+      result = self._cycles.get(component, None)
+      if result is None:
+        result = shortest_cycles_in_component(
+          lambda module: map(names, self._successors.get(ids(module), ())),
+          set(map(names, component)))
+        self._cycles[component] = result
+      results.append(result)
+
+    return merge_shortest_cycles(results)
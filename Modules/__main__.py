@@ -7,6 +7,7 @@ Return codes:
 """
 
 import argparse
+import atexit
 import datetime
 import os
 import re
@@ -15,6 +16,10 @@ import time
 from multiprocessing import cpu_count
 
 import utils
+from ModulesTSMaker.include_cache import IncludeScanCache
+from utils.discovery import DEFAULT_EXCLUDED_DIRECTORIES
+from utils.executor import ExecutorService
+from utils.flow import FLOW_ALGORITHMS
 from utils.graph import nx
 from utils.graph_visualisation import load_for as load_graphviz
 from passes import PassLoader
@@ -92,6 +97,13 @@ PARSER.add_argument('--profile',
                          "about how much each individual pass' execution "
                          "took.")
 
+PARSER.add_argument('--check-sanity',
+                    action='store_true',
+                    help="Verify after each pass that the internal state of "
+                         "the algorithm is still sane, and stop with an "
+                         "error if it is not. Useful for debugging the "
+                         "passes.")
+
 GRAPHS = PARSER.add_argument_group(
   'graph visualisation arguments',
   """Visualise the inner state of the algorithm by plotting the graphs in a
@@ -158,6 +170,66 @@ CONFIGS.add_argument("--module-split-pingpong-threshold",
                           "iterations the same cycle is \"rediscovered\" "
                           "then the algorithm is terminated with an error.")
 
+CONFIGS.add_argument("--flow-algorithm",
+                     choices=sorted(FLOW_ALGORITHMS),
+                     default='builtin',
+                     help="The maximum flow algorithm used to calculate the "
+                          "minimal cuts in the 'split circular module "
+                          "interfaces' step. 'builtin' is an array-based "
+                          "implementation of Dinic's algorithm, the others "
+                          "are run by networkx.")
+
+CONFIGS.add_argument("--record-flow-networks",
+                     dest='flow_record_directory',
+                     metavar="DIRECTORY",
+                     help="Save the flow networks created in the 'split "
+                          "circular module interfaces' step into the given "
+                          "directory, to be replayed with "
+                          "'benchmark-flow.py'.")
+
+CONFIGS.add_argument("--cycle-split-time-budget",
+                     type=float,
+                     default=120,
+                     metavar="SECONDS",
+                     help="The wall-clock time the minimal cut of a single "
+                          "cycle may take in the 'split circular module "
+                          "interfaces' step. Cycles exceeding it are split "
+                          "at their least coupled dependency instead. 0 "
+                          "(or less) means no limit.")
+
+CONFIGS.add_argument("--exclude-dir",
+                     dest='excluded_directories',
+                     action='append',
+                     metavar="DIRECTORY",
+                     help="Name of directories that are not searched for "
+                          "module files and the other files of the project. "
+                          "(The outputs of the analysis are searched for "
+                          "everywhere.) Can be specified multiple times. "
+                          "(Default: %s)"
+                          % ', '.join(DEFAULT_EXCLUDED_DIRECTORIES))
+
+CONFIGS.add_argument("--no-gitignore",
+                     dest='use_gitignore',
+                     action='store_false',
+                     help="Search module files (and the other files of the "
+                          "project) even in the files and directories ignored "
+                          "by the '.gitignore' files of the project.")
+
+CONFIGS.add_argument("--compact-dependency-map",
+                     action='store_true',
+                     help="Store the file-level dependencies in compact "
+                          "arrays instead of dicts. This uses considerably "
+                          "less memory on large projects, at the cost of "
+                          "slower updates to the dependencies.")
+
+CONFIGS.add_argument("--no-include-scan-cache",
+                     dest='use_include_scan_cache',
+                     action='store_false',
+                     help="Do not use (or update) the cache of the scanned "
+                          "\"#include\" directives kept in the folder of the "
+                          "compilation database between the runs, and scan "
+                          "every file again.")
+
 LOGGING = PARSER.add_argument_group('output verbosity arguments')
 
 LOGGING.add_argument('--hide-compiler',
@@ -215,6 +287,12 @@ if ARGS.jobs <= 0:
 utils.logging.verbose("Using '%d' thread(s)..." % ARGS.jobs)
 PassLoader.register_global('THREAD_COUNT', ARGS.jobs)
 
+# The worker pools are created once (when first used), and are shared by
+# every pass.
+EXECUTOR = ExecutorService(ARGS.jobs)
+atexit.register(EXECUTOR.shutdown)
+PassLoader.register_global('EXECUTOR', EXECUTOR)
+
 # Load the visualiser algorithm into the interpreter.
 load_graphviz('dependencies', ARGS.visualise_dependencies)
 load_graphviz('cuts', ARGS.visualise_cuts)
@@ -233,22 +311,51 @@ INCLUDE_PATHS = PassLoader.execute_pass('parse_include_paths_from_cdb')
 PassLoader.register_global('INCLUDE_PATHS', INCLUDE_PATHS)
 
 # Load the necessary knowledge about the project.
+PassLoader.register_global('HEADER_FILE_REGEX', ARGS.header_regex)
+PassLoader.register_global('SOURCE_FILE_REGEX', ARGS.source_file_regex)
+if not ARGS.excluded_directories:
+  ARGS.excluded_directories = DEFAULT_EXCLUDED_DIRECTORIES
+PassLoader.register_global('EXCLUDED_DIRECTORIES', ARGS.excluded_directories)
+PassLoader.register_global('USE_GITIGNORE', ARGS.use_gitignore)
+FILE_CATALOG = PassLoader.execute_pass('build_file_catalog')
+PassLoader.register_global('FILE_CATALOG', FILE_CATALOG)
+PassLoader.register_global('COMPACT_DEPENDENCY_MAP',
+                           ARGS.compact_dependency_map)
 MODULE_MAP, DEPENDENCY_MAP = \
   PassLoader.execute_pass('load_module_mapping')
 PassLoader.register_global('MODULE_MAP', MODULE_MAP)
 PassLoader.register_global('DEPENDENCY_MAP', DEPENDENCY_MAP)
 
+if ARGS.use_include_scan_cache:
+  INCLUDE_SCAN_CACHE = IncludeScanCache(os.path.join(
+    os.path.dirname(PassLoader.get('COMPILE_COMMANDS_JSON')),
+    'include-scan-cache.sqlite'))
+  atexit.register(INCLUDE_SCAN_CACHE.close)
+else:
+  INCLUDE_SCAN_CACHE = None
+PassLoader.register_global('INCLUDE_SCAN_CACHE', INCLUDE_SCAN_CACHE)
+
+# (The files are identified by their IDs in the catalog, except in the
+# include graph: its nodes are the paths as the includes were found, also
+# outside the source folder, and the paths decide the order of the sorted
+# module files.)
 PassLoader.register_global('REMOVE_LINES_FROM_FILES', dict())
 PassLoader.register_global('EXTERNAL_INCLUDE_GRAPH', nx.DiGraph())
 
 PassLoader.execute_pass('load_implements_relations')
+
+if ARGS.check_sanity:
+  def _check_implementation_sanity(pass_name):
+    if DEPENDENCY_MAP.get_implementation_insanity():
+      raise AssertionError("Pass '%s' made the \"implements\" relations "
+                           "insane." % pass_name)
+  PassLoader.add_post_pass_check(_check_implementation_sanity)
 DEFINITIONS, FORWARD_DECLARATIONS = \
   PassLoader.execute_pass('load_module_affected_symbol_table')
 PassLoader.register_global('DEFINITIONS', DEFINITIONS)
 PassLoader.register_global('FORWARD_DECLARATIONS', FORWARD_DECLARATIONS)
 
 # Fetch the dependencies from the headers only.
-PassLoader.register_global('HEADER_FILE_REGEX', ARGS.header_regex)
 PassLoader.register_global('FILTER_FILE_REGEX',
                            PassLoader.get('HEADER_FILE_REGEX'))
 PassLoader.execute_pass('fetch_dependency_includes')
@@ -257,12 +364,19 @@ PassLoader.register_global('FILTER_FILE_REGEX', None)
 # Execute the passes of the algorithm and try to solve modularisation.
 PassLoader.register_global('MODULE_SPLIT_PINGPONG_THRESHOLD',
                            ARGS.module_split_pingpong_threshold)
+PassLoader.register_global('FLOW_ALGORITHM', ARGS.flow_algorithm)
+PassLoader.register_global('FLOW_RECORD_DIRECTORY',
+                           ARGS.flow_record_directory)
+PassLoader.register_global('CYCLE_SPLIT_TIME_BUDGET',
+                           ARGS.cycle_split_time_budget
+                           if ARGS.cycle_split_time_budget > 0 else None)
 PassLoader.execute_pass('solve_potential_module_import_cycles')
 PassLoader.execute_pass('move_implementation_files_to_new_modules')
 
 # After the types had been broken up, implementation files can still have some
 # dependent headers.
-PassLoader.register_global('FILTER_FILE_REGEX', ARGS.source_file_regex)
+PassLoader.register_global('FILTER_FILE_REGEX',
+                           PassLoader.get('SOURCE_FILE_REGEX'))
 PassLoader.execute_pass('fetch_dependency_includes')
 PassLoader.register_global('FILTER_FILE_REGEX', None)
 
@@ -310,3 +424,6 @@ elif ARGS.profile:
         .strftime(r'%Y-%m-%d %H:%M:%S.%f'))
   print("Total execution took %s wall time."
         % datetime.timedelta(seconds=END_AT - START_AT))
+  if INCLUDE_SCAN_CACHE:
+    print("Include scan cache: %d hit(s), %d miss(es)."
+          % (INCLUDE_SCAN_CACHE.hits, INCLUDE_SCAN_CACHE.misses))
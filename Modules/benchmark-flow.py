@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import os
+import pickle
+import sys
+import time
+
+from utils.flow import FLOW_ALGORITHMS, minimum_cut
+from utils.progress_bar import tqdm
+
+# ------------------- Set up the command-line configuration -------------------
+
+PARSER = argparse.ArgumentParser(
+    prog='benchmark-flow',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    description="Replays the flow networks recorded by the main tool with "
+                "'--record-flow-networks' against the maximum flow "
+                "algorithms, and compares their running time and results.")
+
+PARSER.add_argument("record_dir",
+                    type=str,
+                    help="The directory the flow networks were recorded "
+                         "into.")
+
+PARSER.add_argument("--algorithm",
+                    dest='algorithms',
+                    action='append',
+                    choices=sorted(FLOW_ALGORITHMS),
+                    help="The algorithm to benchmark. Can be specified "
+                         "multiple times. (Default: every algorithm.)")
+
+PARSER.add_argument("--repeat",
+                    type=int,
+                    default=3,
+                    help="The number of times each network is cut by each "
+                         "algorithm. The fastest run is taken.")
+
+ARGS = PARSER.parse_args()
+
+if ARGS.repeat <= 0:
+    print("ERROR: Non-positive repeat count.", file=sys.stderr)
+    sys.exit(2)
+
+ALGORITHMS = ARGS.algorithms or sorted(FLOW_ALGORITHMS)
+# The reference results are the ones of the builtin algorithm.
+if 'builtin' not in ALGORITHMS:
+    ALGORITHMS.insert(0, 'builtin')
+else:
+    ALGORITHMS.insert(0, ALGORITHMS.pop(ALGORITHMS.index('builtin')))
+
+# ------------------------- Real execution begins now -------------------------
+
+RECORDS = sorted(glob.glob(os.path.join(ARGS.record_dir, '*.pickle')))
+if not RECORDS:
+    print("ERROR: No recorded flow networks found in '%s'." % ARGS.record_dir,
+          file=sys.stderr)
+    sys.exit(1)
+
+times = dict((algorithm, 0.0) for algorithm in ALGORITHMS)
+value_mismatches = dict((algorithm, 0) for algorithm in ALGORITHMS)
+cut_mismatches = dict((algorithm, 0) for algorithm in ALGORITHMS)
+node_count, edge_count = 0, 0
+
+for record_file in tqdm(RECORDS,
+                        desc="Replaying flow networks...",
+                        unit="network"):
+    with open(record_file, 'rb') as f:
+        record = pickle.load(f)
+    flow, source, sink = record['flow'], record['source'], record['sink']
+    node_count += len(flow)
+    edge_count += sum(1 for _ in flow.edges())
+
+    reference = None
+    for algorithm in ALGORITHMS:
+        best = None
+        for _ in range(ARGS.repeat):
+            start = time.perf_counter()
+            result = minimum_cut(flow, source, sink, algorithm)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times[algorithm] += best
+
+        if reference is None:
+            reference = result
+            continue
+        if result[0] != reference[0]:
+            value_mismatches[algorithm] += 1
+            print("Cut value mismatch on '%s' (cycle %s): %s gave %d, "
+                  "builtin gave %d."
+                  % (record_file, ' -> '.join(record['cycle']), algorithm,
+                     result[0], reference[0]),
+                  file=sys.stderr)
+        elif result[1] != reference[1]:
+            cut_mismatches[algorithm] += 1
+
+print("Replayed %d flow networks (%d nodes, %d edges in total), taking the "
+      "fastest of %d runs each." % (len(RECORDS), node_count, edge_count,
+                                    ARGS.repeat))
+print("%-20s %12s %12s %12s %12s" % ("Algorithm", "Total (s)", "Mean (ms)",
+                                     "Value diff", "Cut diff"))
+for algorithm in ALGORITHMS:
+    print("%-20s %12.4f %12.4f %12d %12d"
+          % (algorithm, times[algorithm],
+             times[algorithm] * 1000 / len(RECORDS),
+             value_mismatches[algorithm], cut_mismatches[algorithm]))
+
+if any(value_mismatches.values()):
+    sys.exit(1)
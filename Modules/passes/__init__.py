@@ -19,6 +19,7 @@ class PassLoader():
   loaded_passes = dict()
   cfg_globals = dict()
   timing_informations = list()
+  post_pass_checks = list()
 
   @classmethod
   def load_stage(cls, pass_name):
@@ -47,6 +48,14 @@ class PassLoader():
   def get(cls, var):
     return cls.cfg_globals.get(var, None)
 
+  @classmethod
+  def add_post_pass_check(cls, check):
+    """
+    Register the :param check: callable to be called with the name of the
+    pass after every subsequently executed pass.
+    """
+    cls.post_pass_checks.append(check)
+
   @classmethod
   def execute_pass(cls, pass_name):
     """
@@ -77,4 +86,8 @@ class PassLoader():
     ended = time.time()
 
     cls.timing_informations.append((pass_name, started, ended))
+
+    for check in cls.post_pass_checks:
+      check(pass_name)
+
     return returns
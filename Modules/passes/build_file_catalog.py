@@ -0,0 +1,15 @@
+from ModulesTSMaker.catalog import FileCatalog
+
+
+DESCRIPTION = "Build the catalog of files in the source folder"
+
+
+def main(START_FOLDER, HEADER_FILE_REGEX, SOURCE_FILE_REGEX,
+         EXCLUDED_DIRECTORIES, USE_GITIGNORE):
+  """
+  Walk the source folder once and intern every file found into a catalog
+  that the later passes can query instead of walking the tree themselves.
+  """
+  catalog = FileCatalog(START_FOLDER, HEADER_FILE_REGEX, SOURCE_FILE_REGEX)
+  catalog.scan(EXCLUDED_DIRECTORIES, USE_GITIGNORE)
+  return catalog
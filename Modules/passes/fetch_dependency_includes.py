@@ -1,6 +1,6 @@
-import codecs
 import os
 import sys
+from functools import partial
 from operator import itemgetter
 
 from ModulesTSMaker import include
@@ -48,14 +48,13 @@ def _recurse_includes(start_folder,
     return file
 
   if known_external_includes is None:
-    try:
-      with codecs.open(file, 'r',
-                       encoding='utf-8', errors='replace') as f:
-        known_external_includes = include.get_included_files(f.read())
-    except OSError as e:
-      utils.logging.normal("OSerror on file '%s': %s" % (file, str(e)),
+    include_lines, _, error = include.scan_file(file)
+    if error is not None:
+      utils.logging.normal("OSerror on file '%s': %s" % (file, error),
                               file=sys.stderr)
       return False
+    # (The includes are followed in the order of the lines.)
+    known_external_includes = list(map(itemgetter(1), sorted(include_lines)))
 
   for next_include in known_external_includes:
     include_found_at = _recurse_includes(start_folder,
@@ -88,40 +87,93 @@ def _recurse_includes(start_folder,
   return file
 
 
+def _scan_files(files, file_catalog, executor, include_scan_cache):
+  """
+  Scan the include directives of :param files: with :func include.scan_file:
+  in parallel on the process pool of :param executor:. The files whose
+  directives are in :param include_scan_cache: (if given) are not scanned.
+
+  :return: A generator of the result of :func include.scan_file: (without the
+  hash) for every file, in order.
+  """
+  cached = dict()
+  if include_scan_cache is not None:
+    for file in files:
+      directives = include_scan_cache.lookup(
+        file,
+        file_catalog.get_size(file),
+        file_catalog.get_mtime(file),
+        partial(file_catalog.get_content_hash, file))
+      if directives is not None:
+        cached[file] = directives
+  files_to_scan = [file for file in files if file not in cached]
+
+  scans = executor.process_pool.imap(
+    include.scan_file, files_to_scan,
+    chunksize=max(1, len(files_to_scan) // (4 * (executor.jobs or 1))))
+  for file in files:
+    if file in cached:
+      yield cached[file], None
+      continue
+
+    include_lines, content_hash, error = next(scans)
+    if include_scan_cache is not None and error is None:
+      include_scan_cache.store(file,
+                               file_catalog.get_size(file),
+                               file_catalog.get_mtime(file),
+                               content_hash,
+                               include_lines)
+    yield include_lines, error
+
+  if include_scan_cache is not None:
+    include_scan_cache.commit()
+    utils.logging.verbose("Include scan cache: %d file(s) cached, %d "
+                          "scanned." % (len(cached), len(files_to_scan)))
+
+
 def main(START_FOLDER,
          MODULE_MAP,
          DEPENDENCY_MAP,
          INCLUDE_PATHS,
          FILTER_FILE_REGEX,
          REMOVE_LINES_FROM_FILES,
-         EXTERNAL_INCLUDE_GRAPH):
+         EXTERNAL_INCLUDE_GRAPH,
+         EXECUTOR,
+         FILE_CATALOG,
+         INCLUDE_SCAN_CACHE=None):
   # Handle removing #include directives from files matching the given RegEx and
   # adding them as module imports instead.
   files = list(filter(FILTER_FILE_REGEX.search,
                       MODULE_MAP.get_all_fragments()))
-  for file in tqdm(files,
-                   desc="Collecting includes",
-                   unit='file',
-                   position=1):
-    try:
-      with codecs.open(file, 'r', encoding='utf-8', errors='replace') as f:
-        content = f.read()
-    except OSError as e:
-      utils.logging.essential("Couldn't read file '%s': %s" % (file, e),
+
+  # The files are read and their include directives are extracted in
+  # parallel (unless they are cached), while the directives are resolved
+  # against the (shared) maps in order, on this thread.
+  scans = _scan_files(files, FILE_CATALOG, EXECUTOR, INCLUDE_SCAN_CACHE)
+  # The fragments of the modules do not change in this pass, so the includes
+  # are resolved with the same resolver.
+  resolver = include.IncludeResolver(MODULE_MAP, INCLUDE_PATHS)
+  for file, (include_lines, error) in tqdm(zip(files, scans),
+                                           desc="Collecting includes",
+                                           total=len(files),
+                                           unit='file'):
+    if error is not None:
+      utils.logging.essential("Couldn't read file '%s': %s" % (file, error),
                               file=sys.stderr)
       continue
 
     lines_to_remove_from_file, lines_to_keep = \
-      include.filter_imports_from_includes(file,
-                                           content,
-                                           MODULE_MAP,
-                                           DEPENDENCY_MAP,
-                                           INCLUDE_PATHS)
+      include.resolve_include_directives(file,
+                                         include_lines,
+                                         MODULE_MAP,
+                                         DEPENDENCY_MAP,
+                                         INCLUDE_PATHS,
+                                         resolver)
 
     if not lines_to_remove_from_file:
       continue
     utils.append_to_dict_element(REMOVE_LINES_FROM_FILES,
-                                 file,
+                                 FILE_CATALOG.get_id(file),
                                  lines_to_remove_from_file)
 
     if not lines_to_keep:
@@ -136,7 +188,4 @@ def main(START_FOLDER,
                       # Start the original recursion only on the "known"
                       # includes that did not match inside the module map.
                       known_external_includes=list(
-                        map(include.directive_to_filename,
-                            map(itemgetter(1), lines_to_keep))))
-
-  print()  # Line feed after tqdm progress bar so it's not overwritten.
+                        map(itemgetter(1), lines_to_keep)))
@@ -10,34 +10,26 @@ except ImportError as e:
   raise
 
 from ModulesTSMaker import mapping
-from utils import graph, logging
+from ModulesTSMaker.module_graph import ModuleGraph
+from utils import logging
 from utils.graph_visualisation import get_visualizer as graph_visualisation
 
 
 DESCRIPTION = "Solve dependency cycles by merging module contents"
 
 
-def _fold_cycles(module_map, dependency_map):
+def _fold_cycles(module_map, dependency_map, module_graph):
   """
   Executes the folding of cyclical dependencies into a new merged module.
+  The cycles are searched in :param module_graph:, which observes the
+  :param module_map:.
 
   :return: A dict of modules the merge (in the format of ret[k] is a list, and
   modules in this list should be merged into k). If no merges are necessary,
   return explicit True.
   """
-  def _map_to_dependencies(module):
-    """
-    Helper function to create a dictionary key mapping :param module: to its
-    dependencies.
-    """
-    return (module,
-            # Return the dependencies as a list, sorted, as opposed to a set,
-            # so the order is deterministic.
-            sorted(module_map.get_dependencies_of_module(module)))
-
-  dependencies = dict(map(_map_to_dependencies, module_map))
-  cycle_lengths_minimum, minimum_long_cycles = graph.simple_cycles(
-      dependencies)
+  cycle_lengths_minimum, minimum_long_cycles = \
+    module_graph.get_shortest_cycles()
   if not minimum_long_cycles:
       return True
 
@@ -156,13 +148,17 @@ def main(MODULE_MAP, DEPENDENCY_MAP):
   # as this stage operates based on them.
   DEPENDENCY_MAP.synthesize_intermodule_imports()
 
+  # The graph of the imports is kept up to date as the files are moved, so
+  # the cycles are only searched again in the parts that changed.
+  module_graph = ModuleGraph(MODULE_MAP)
+
   iteration_count = 1
   while True:
     logging.essential(
       "========->> Begin iteration %d trying to merge cycles.. <<-========"
       % iteration_count)
 
-    modules_to_move = _fold_cycles(MODULE_MAP, DEPENDENCY_MAP)
+    modules_to_move = _fold_cycles(MODULE_MAP, DEPENDENCY_MAP, module_graph)
     if modules_to_move is True:
       logging.normal("Nothing to do.")
       break
@@ -183,6 +179,7 @@ def main(MODULE_MAP, DEPENDENCY_MAP):
       mapping.apply_file_moves(MODULE_MAP, DEPENDENCY_MAP, file_moves)
       iteration_count += 1
 
+  module_graph.detach()
   mapping.fix_module_names(MODULE_MAP, DEPENDENCY_MAP)
 
   logging.essential(
@@ -8,11 +8,13 @@ from utils.progress_bar import tqdm
 DESCRIPTION = "Load \"implements\" relations from the analysed compilations"
 
 
-def main(START_FOLDER, MODULE_MAP, DEPENDENCY_MAP):
+def main(START_FOLDER, FILE_CATALOG, MODULE_MAP, DEPENDENCY_MAP):
   # The SYMBOL_ANALYSER_BINARY emits the knowledge about what file implements
   # symbols from what other file. This has to be added to the algorithm's
   # knowledge, as Module files (CPPMs) have to contain *both* interface and
   # implementation.
+  # (The outputs of the analysis are usually in directories excluded from the
+  # catalog, e.g. the build folder, so the whole tree is searched.)
   header_implements_files = list(
     filter(lambda s: s.endswith("-implements.txt"),
            utils.walk_folder(START_FOLDER)))
@@ -25,8 +27,8 @@ def main(START_FOLDER, MODULE_MAP, DEPENDENCY_MAP):
         #     main.cpp##something.h
         try:
           parts = line.strip().split('##')
-          implementee = utils.strip_folder(START_FOLDER, parts[0])
-          implemented = utils.strip_folder(START_FOLDER, parts[1])
+          implementee = FILE_CATALOG.relpath(parts[0])
+          implemented = FILE_CATALOG.relpath(parts[1])
           DEPENDENCY_MAP.add_dependency(implementee, implemented, 'implements')
         except ValueError as ve:
           utils.logging.normal("Implements relation failed, because: %s"
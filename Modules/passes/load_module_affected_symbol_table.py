@@ -25,64 +25,93 @@ def unpack_symbol_line(line):
   return file, (begin_row, begin_col), (end_row, end_col), name
 
 
-def main(START_FOLDER):
+def _read_symbol_file(emitted_file):
+  """
+  Read and unpack the symbols of :param emitted_file:.
+
+  :return: The list of the lines of the file that could be unpacked, as
+  (line, unpacked symbol) pairs, where the unpacked symbol is None for the
+  invalid lines.
+  """
+  ret = list()
+  with open(emitted_file, 'r') as handle:
+    for line in handle:
+      try:
+        ret.append((line, unpack_symbol_line(line)))
+      except IndexError:
+        ret.append((line, None))
+  return ret
+
+
+def main(START_FOLDER, FILE_CATALOG, EXECUTOR):
   """
   The SymbolAnalyser binary emits a partial symbol table that can be used to
   fine tune module boundaries.
 
-  :return: The loaded symbol tables, a pair of dicts.
+  :return: The loaded symbol tables, a pair of dicts. The files in them are
+  identified by their IDs in :param FILE_CATALOG:.
   """
+  # The outputs of the analysis are usually in directories excluded from the
+  # catalog (e.g. the build folder), so the whole tree is searched, once.
+  emitted_files = list(filter(
+    lambda s: s.endswith(('-definitions.txt', '-forwarddeclarations.txt')),
+    utils.walk_folder(START_FOLDER)))
+
   definitions = dict()
   definition_files = list(filter(
         lambda s: s.endswith('-definitions.txt'),
-        utils.walk_folder(START_FOLDER)))
-  for emitted_file in tqdm(definition_files,
-                           desc="Loading symbol table",
-                           unit='definition file'):
-    with open(emitted_file, 'r') as handle:
-      for line in handle:
-        try:
-          file, begin_loc, end_loc, symbol_name = unpack_symbol_line(line)
-          file = utils.strip_folder(START_FOLDER, file)
-
-          utils.append_to_dict_element(definitions,
-                                       symbol_name,
-                                       file,
-                                       set(),
-                                       set.add)
-        except IndexError:
-          utils.logging.essential("Invalid directive in file:\n\t%s" % line,
-                                  file=sys.stderr)
-          continue
+        emitted_files))
+  # The files are read and parsed in parallel, and the results are collected
+  # in order.
+  for symbols in tqdm(EXECUTOR.thread_pool.imap(_read_symbol_file,
+                                                definition_files),
+                      desc="Loading symbol table",
+                      total=len(definition_files),
+                      unit='definition file'):
+    for line, symbol in symbols:
+      if symbol is None:
+        utils.logging.essential("Invalid directive in file:\n\t%s" % line,
+                                file=sys.stderr)
+        continue
+
+      file, begin_loc, end_loc, symbol_name = symbol
+      file_id = FILE_CATALOG.get_id(FILE_CATALOG.relpath(file))
+
+      utils.append_to_dict_element(definitions,
+                                   symbol_name,
+                                   file_id,
+                                   set(),
+                                   set.add)
 
   for symbol, files in filter(lambda e: len(e[1]) > 1,
                               definitions):
     utils.logging.normal("WARNING: Symbol '%s' is defined by multiple files: "
-                         "%s" % (symbol, ', '.join(sorted(files))),
+                         "%s" % (symbol, ', '.join(
+                           sorted(map(FILE_CATALOG.get_path, files)))),
                          file=sys.stderr)
 
   forward_declarations = dict()
   fwddecl_files = list(filter(
     lambda s: s.endswith('-forwarddeclarations.txt'),
-    utils.walk_folder(START_FOLDER)))
-  for emitted_file in tqdm(fwddecl_files,
-                           desc="Loading symbol table",
-                           unit='declaration file'):
-    with open(emitted_file, 'r') as handle:
-      for line in handle:
-        try:
-          file, (begin_line, begin_col), end_loc, symbol_name = \
-            unpack_symbol_line(line)
-          file = utils.strip_folder(START_FOLDER, file)
-
-          utils.append_to_dict_element(forward_declarations,
-                                       file,
-                                       (begin_line, symbol_name),
-                                       set(),
-                                       set.add)
-        except IndexError:
-          utils.logging.essential("Invalid directive in file:\n\t%s" % line,
-                                  file=sys.stderr)
-          continue
+    emitted_files))
+  for symbols in tqdm(EXECUTOR.thread_pool.imap(_read_symbol_file,
+                                                fwddecl_files),
+                      desc="Loading symbol table",
+                      total=len(fwddecl_files),
+                      unit='declaration file'):
+    for line, symbol in symbols:
+      if symbol is None:
+        utils.logging.essential("Invalid directive in file:\n\t%s" % line,
+                                file=sys.stderr)
+        continue
+
+      file, (begin_line, begin_col), end_loc, symbol_name = symbol
+      file_id = FILE_CATALOG.get_id(FILE_CATALOG.relpath(file))
+
+      utils.append_to_dict_element(forward_declarations,
+                                   file_id,
+                                   (begin_line, symbol_name),
+                                   set(),
+                                   set.add)
 
   return definitions, forward_declarations
@@ -7,10 +7,24 @@ from utils import logging
 DESCRIPTION = "Load initial module mapping from the source folder(s)"
 
 
-def main(START_FOLDER):
+def main(START_FOLDER,
+         FILE_CATALOG,
+         EXCLUDED_DIRECTORIES,
+         USE_GITIGNORE,
+         THREAD_COUNT,
+         EXECUTOR,
+         COMPACT_DEPENDENCY_MAP):
   # Get the current pre-existing module mapping for the project.
-  module_map, duplicates = mapping.get_module_mapping(START_FOLDER)
-  dependency_map = mapping.DependencyMap(module_map)
+  module_map, duplicates = mapping.get_module_mapping(START_FOLDER,
+                                                      FILE_CATALOG,
+                                                      EXCLUDED_DIRECTORIES,
+                                                      USE_GITIGNORE,
+                                                      THREAD_COUNT,
+                                                      EXECUTOR.thread_pool)
+  if COMPACT_DEPENDENCY_MAP:
+    dependency_map = mapping.CompactDependencyMap(module_map)
+  else:
+    dependency_map = mapping.DependencyMap(module_map)
 
   if duplicates:
     logging.essential("Error: Some files are included into multiple modules. "
@@ -18,6 +18,7 @@ DESCRIPTION = "Join modules together based on forward declarations' coupling"
 
 def main(MODULE_MAP,
          DEPENDENCY_MAP,
+         FILE_CATALOG,
          DEFINITIONS,
          FORWARD_DECLARATIONS):
   """
@@ -32,11 +33,14 @@ def main(MODULE_MAP,
   represent a bond that the user (because eventually a forward declaration
   in a header will be (in the vast majority of cases) used in the
   implementation file.
+
+  (The files in :param DEFINITIONS: and :param FORWARD_DECLARATIONS: are
+  identified by their IDs in :param FILE_CATALOG:.)
   """
   definitions_to_modules = dict()
   for symbol, file_list in DEFINITIONS.items():
     definitions_to_modules[symbol] = set()
-    for file in file_list:
+    for file in map(FILE_CATALOG.get_path, file_list):
       for modules_for_definition in MODULE_MAP.get_modules_for_fragment(file):
         definitions_to_modules[symbol].add(modules_for_definition)
 
@@ -44,9 +48,10 @@ def main(MODULE_MAP,
   # implementation for us this way.
   module_merges = nx.Graph({m: [] for m in MODULE_MAP})
 
-  for file in tqdm(FORWARD_DECLARATIONS,
-                   desc="Moving forward declarations",
-                   unit='file'):
+  for file_id in tqdm(FORWARD_DECLARATIONS,
+                      desc="Moving forward declarations",
+                      unit='file'):
+    file = FILE_CATALOG.get_path(file_id)
     modules_of_fwding_file = set(MODULE_MAP.get_modules_for_fragment(file))
     if not modules_of_fwding_file:
       # If a file does not belong to a module, ignore it.
@@ -60,7 +65,7 @@ def main(MODULE_MAP,
       sys.exit(1)
     modules_of_fwding_file = list(modules_of_fwding_file)
 
-    for line, symbol in FORWARD_DECLARATIONS[file]:
+    for line, symbol in FORWARD_DECLARATIONS[file_id]:
       modules_of_definition = definitions_to_modules.get(symbol, set())
       if not modules_of_definition:
         logging.verbose("Symbol '%s' forward declared in %s was not found in "
@@ -75,7 +80,8 @@ def main(MODULE_MAP,
                           "for module merging."
                           % (symbol, file,
                              ', '.join(modules_of_definition),
-                             ', '.join(DEFINITIONS[symbol])),
+                             ', '.join(map(FILE_CATALOG.get_path,
+                                           DEFINITIONS[symbol]))),
                           file=sys.stderr)
         continue
         sys.exit(1)
@@ -87,7 +93,8 @@ def main(MODULE_MAP,
                       "refers to definition in %s in module %s. Setting up "
                       "modules for merge."
                       % (symbol, file, modules_of_fwding_file[0],
-                         list(DEFINITIONS[symbol])[0],
+                         FILE_CATALOG.get_path(
+                           next(iter(DEFINITIONS[symbol]))),
                          modules_of_definition[0]))
       module_merges.add_edge(modules_of_fwding_file[0],
                              modules_of_definition[0])
@@ -5,7 +5,7 @@ from utils.progress_bar import tqdm
 DESCRIPTION = "Move implementation files to the module of their interfaces"
 
 
-def main(MODULE_MAP, DEPENDENCY_MAP, HEADER_FILE_REGEX):
+def main(MODULE_MAP, DEPENDENCY_MAP, FILE_CATALOG):
   # Headers have been moved at this point, but only the module map in memory
   # has changed, not the original source code. The next step is to move the
   # non-header files alongside with the headers, for the types they implement
@@ -16,7 +16,7 @@ def main(MODULE_MAP, DEPENDENCY_MAP, HEADER_FILE_REGEX):
                      unit='module'):
     files_in_module = MODULE_MAP.get_fragment_list(module)
 
-    for header in filter(HEADER_FILE_REGEX.search, files_in_module):
+    for header in filter(FILE_CATALOG.is_header, files_in_module):
       dependee_set = DEPENDENCY_MAP.get_dependees(header)
       for dependee, kind in dependee_set:
         if kind != 'implements':
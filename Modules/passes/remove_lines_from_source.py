@@ -8,33 +8,52 @@ from utils.progress_bar import tqdm
 DESCRIPTION = "Remove unnecessary lines from source files"
 
 
-def main(REMOVE_LINES_FROM_FILES, NON_TOPOLOGICAL_FILES):
-  for file, remove_list in tqdm(sorted(REMOVE_LINES_FROM_FILES.items()),
-                                desc="Removing obsolete source text",
-                                unit='file'):
+def _remove_lines(file, remove_list):
+  """
+  Remove the lines in :param remove_list: from :param file:.
+
+  :return: The error message to log if the file could not be rewritten, or
+  None.
+  """
+  try:
+    with codecs.open(file, 'r', encoding='utf-8', errors='replace') as f:
+      content = f.read()
+  except OSError as e:
+    return "Couldn't read file '%s': %s" % (file, e)
+
+  # (The lines are numbered the same way as the include directives were
+  # found, by '\n' separators only.)
+  lines = content.split('\n')
+  linenos_to_remove = set(map(itemgetter(0), remove_list))
+  try:
+    with codecs.open(file, 'w', encoding='utf-8', errors='replace') as f:
+      f.write('\n'.join(line for i, line in enumerate(lines)
+                        if i not in linenos_to_remove))
+  except OSError as e:
+    return "Couldn't write file '%s': %s" % (file, e)
+
+  return None
+
+
+def main(REMOVE_LINES_FROM_FILES, NON_TOPOLOGICAL_FILES, FILE_CATALOG,
+         EXECUTOR):
+  files_to_rewrite = list()
+  for file, remove_list in sorted(
+        (FILE_CATALOG.get_path(file_id), remove_list)
+        for file_id, remove_list in REMOVE_LINES_FROM_FILES.items()):
     if file in NON_TOPOLOGICAL_FILES:
         logging.normal("%s: File marked as non-topological, not touching..."
                        % (file),
                        file=sys.stderr)
         continue
+    files_to_rewrite.append((file, remove_list))
 
-    try:
-      with codecs.open(file, 'r', encoding='utf-8', errors='replace') as f:
-        content = f.read()
-    except OSError as e:
-      logging.essential("Couldn't read file '%s': %s" % (file, e),
-                        file=sys.stderr)
-      continue
-
-    lines = content.splitlines(True)
-    linenos_to_remove = set(map(itemgetter(0), remove_list))
-    try:
-      with codecs.open(file, 'w', encoding='utf-8', errors='replace') as f:
-        for i, line in enumerate(lines):
-          if i in linenos_to_remove:
-            continue
-          f.write(line)
-    except OSError as e:
-      logging.essential("Couldn't write file '%s': %s" % (file, e),
-                        file=sys.stderr)
-      continue
+  # The files are independent of each other, so they are rewritten in
+  # parallel.
+  for error in tqdm(EXECUTOR.thread_pool.imap(
+                      lambda args: _remove_lines(*args), files_to_rewrite),
+                    desc="Removing obsolete source text",
+                    total=len(files_to_rewrite),
+                    unit='file'):
+    if error:
+      logging.essential(error, file=sys.stderr)
@@ -7,7 +7,20 @@ from utils.progress_bar import tqdm
 DESCRIPTION = "Rename conflicting symbols in the merged files"
 
 
-def main(START_FOLDER):
+def _apply_renames(filename, renames):
+  """
+  Apply the :param renames: (parsed directives, in order) to :param filename:.
+
+  :return: The directive lines whose replacement failed.
+  """
+  failed = list()
+  for line, row, col, from_str, to_str in renames:
+    if not utils.replace_at_position(filename, row, col, from_str, to_str):
+      failed.append(line)
+  return failed
+
+
+def main(START_FOLDER, EXECUTOR):
   """
   The symbol rewriter binary creates outputs for files specifying in which
   file at what position a rename must be made so concatenated implementation
@@ -16,9 +29,11 @@ def main(START_FOLDER):
   """
   symbol_rename_files = list(filter(lambda s: s.endswith("-badsymbols.txt"),
                                     utils.walk_folder(START_FOLDER)))
-  for directive_file in tqdm(symbol_rename_files,
-                             desc="Renaming problematic symbols",
-                             unit='file'):
+  # Multiple directive files can rename in the same file, so the directives
+  # are collected for each renamed file first, in the order they are to be
+  # applied.
+  renames_of_files = dict()
+  for directive_file in symbol_rename_files:
     with open(directive_file, 'r') as directive_handle:
       for line in reversed(list(directive_handle)):
         # Parse the output of the directive file. A line is formatted like:
@@ -34,13 +49,23 @@ def main(START_FOLDER):
           from_str = parts[2]
           to_str = parts[3]
 
-          success = utils.replace_at_position(filename,
-                                              int(row), int(col),
-                                              from_str, to_str)
-          if not success:
-            utils.logging.normal("Replacement failed for directive: %s" % line,
-                                 file=sys.stderr)
+          utils.append_to_dict_element(
+            renames_of_files,
+            filename,
+            [(line, int(row), int(col), from_str, to_str)])
         except IndexError:
           utils.logging.essential("Invalid directive in file:\n\t%s" % line,
                                   file=sys.stderr)
           continue
+
+  # The renamed files are independent of each other, so they are rewritten
+  # in parallel.
+  for failed in tqdm(EXECUTOR.thread_pool.imap(
+                       lambda args: _apply_renames(*args),
+                       renames_of_files.items()),
+                     desc="Renaming problematic symbols",
+                     total=len(renames_of_files),
+                     unit='file'):
+    for line in failed:
+      utils.logging.normal("Replacement failed for directive: %s" % line,
+                           file=sys.stderr)
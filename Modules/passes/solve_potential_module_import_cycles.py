@@ -1,8 +1,14 @@
 import itertools
-import multiprocessing
 import operator
+import os
+import pickle
 import sys
-from collections import Counter, deque
+import tempfile
+import time
+from array import array
+from collections import Counter, OrderedDict, deque
+from functools import partial
+from hashlib import md5
 
 try:
   import networkx as nx
@@ -13,41 +19,73 @@ except ImportError as e:
   raise
 
 from ModulesTSMaker import mapping, util
+from ModulesTSMaker.module_graph import ModuleGraph
 from utils import graph, logging
-from utils.graph_visualisation import get_visualizer as graph_visualisation
+from utils.flow import FlowNetwork, minimum_cut
+from utils.graph_visualisation import get_visualizer as graph_visualisation, \
+  is_enabled as graph_visualisation_enabled
 
 
 DESCRIPTION = "Solve potential module import cycles by splitting modules"
 
+# The roles of the nodes in the flow network created for a cycle. The nodes
+# are labelled with (role, module or file name) pairs.
+SOURCE, SINK, MODULE, DEPENDEE, DEPENDENCY = range(5)
+# The names of the nodes with each role, as shown in the visualisation.
+NODE_NAME_FORMATS = ['%s ->', '-> %s', '-> %s ->', '%s ->', '-> %s']
+
+
+def _node_name(flow, node):
+  role, name = flow.get_label(node)
+  return NODE_NAME_FORMATS[role] % name
+
+
+def _record_flow(directory, cycle, flow):
+  """
+  Save the :param flow: network created for :param cycle: into a new file
+  in :param directory:, to be replayed by 'benchmark-flow.py'.
+  """
+  handle, path = tempfile.mkstemp(prefix='flow-', suffix='.pickle',
+                                  dir=directory)
+  with os.fdopen(handle, 'wb') as f:
+    pickle.dump({'cycle': cycle,
+                 'flow': flow,
+                 'source': flow.find_node((SOURCE, cycle[0])),
+                 'sink': flow.find_node((SINK, cycle[0]))},
+                f)
+
 
 def _create_flow_for_cycle_graph(cycle,
                                  cycle_file_graph,
                                  module_to_files_map):
   """
-  Create a flow graph that has a node for each module in the :param cycle:.
+  Create a flow network that has a node for each module in the :param cycle:.
   The result flow can be used to create a minimal cut for file reassignment
   into a different module.
 
+  The nodes of the network are labelled with (role, name) pairs: the first
+  module of the cycle has a SOURCE and a SINK node, the other modules have a
+  MODULE node, and the files have a DEPENDEE node (if they depend on other
+  files) and a DEPENDENCY node (if other files depend on them).
+
   :param cycle_file_graph: The original dependency directed graph that links
   files to each other.
   :param module_to_files_map: A map that assigns a list of files belonging to
   a particular module.
   """
-  flow = nx.DiGraph()
+  flow = FlowNetwork()
+  node = flow.add_node
 
   for module in cycle[:-1]:  # Only iterate the path, not the full cycle.
     if module == cycle[0]:
       # Create a "start" and "end" node for the source and sink of the
       # cycle.
-      dependee_node = module + ' ->'
-      dependency_node = '-> ' + module
-
-      flow.add_node(dependee_node)
-      flow.add_node(dependency_node)
+      dependee_node = node((SOURCE, module))
+      dependency_node = node((SINK, module))
     else:
-      # Inner elements only get one node.
-      dependee_node = dependency_node = '-> ' + module + ' ->'
-      flow.add_node(dependee_node)
+      # Inner elements only get one node. (It is only created if any file is
+      # linked to it, as an isolated vertex would be useless.)
+      dependee_node = dependency_node = None
 
     # filename -> (#-of-files-f-depends-upon, #-of-files-depending-on-f)
     degree_map = dict(
@@ -65,82 +103,76 @@ def _create_flow_for_cycle_graph(cycle,
 
       if in_degree > 0:
         # file_in_module is a dependency of other files.
-        flow.add_node('-> ' + file_in_module)
+        file_dependency_node = node((DEPENDENCY, file_in_module))
 
         if module == cycle[0]:
           # (If the file is in the cycle's sidemost module, write it to
           # the source.)
-          flow.add_edge('-> ' + file_in_module,
-                        dependency_node)
+          flow.add_edge(file_dependency_node, dependency_node)
 
       if out_degree > 0:
         # file_in_module depends on other files.
-        flow.add_node(file_in_module + ' ->')
+        file_dependee_node = node((DEPENDEE, file_in_module))
 
         if module == cycle[0]:
           # (If the file is in the cycle's sidemost module, write it to
           # the sink.)
-          flow.add_edge(dependee_node,
-                        file_in_module + ' ->')
+          flow.add_edge(dependee_node, file_dependee_node)
 
       if module != cycle[0]:
         if in_degree > 0 and out_degree > 0:
           # If the file is both a dependency and depends on others, link
           # the two file nodes.
-          flow.add_edge('-> ' + file_in_module,
-                        file_in_module + ' ->')
+          flow.add_edge(file_dependency_node, file_dependee_node)
         else:
           # Otherwise link the file to the module on the "side" it can be
           # appropriate.
           # (Here, to ensure the flow cuts at the right position, we
           # limit the flow that can go through a file.)
           if out_degree > 0:
-            flow.add_edge(dependee_node,
-                          file_in_module + ' ->',
-                          capacity=out_degree if any_file_on_both_sides
-                          else float('inf'))
+            flow.add_edge(node((MODULE, module)),
+                          file_dependee_node,
+                          out_degree if any_file_on_both_sides else None)
           if in_degree > 0:
-            flow.add_edge('-> ' + file_in_module,
-                          dependency_node,
-                          capacity=in_degree if any_file_on_both_sides
-                          else float('inf'))
-
-    if module != cycle[0]:
-      # If all files for a module had been added and every such file appeared
-      # "on both sides" (both as a dependency and one that depends on others),
-      # then the module's node is an isolated vertex... it's useless, remove
-      # it.
-      if nx.is_isolate(flow, dependee_node):
-        flow.remove_node(dependee_node)
-      if nx.is_isolate(flow, dependency_node):
-        flow.remove_node(dependency_node)
+            flow.add_edge(file_dependency_node,
+                          node((MODULE, module)),
+                          in_degree if any_file_on_both_sides else None)
 
   # Add the actual dependency edges between the files.
   for dependency_edge in cycle_file_graph.edges:
-    flow.add_edge(dependency_edge[0] + ' ->',
-                  '-> ' + dependency_edge[1],
-                  capacity=1)
+    flow.add_edge(node((DEPENDEE, dependency_edge[0])),
+                  node((DEPENDENCY, dependency_edge[1])),
+                  1)
 
   return flow
 
 
-# FIXME: Introduce a method transforming file-to-node and node-to-file (->).
-
-
-def _files_from_cutting_edges(module_map, flow_graph, cutting_edges):
+def _files_from_cutting_edges(flow_graph, cutting_edges):
   """
-  Using the given :param module_map: and :param flow_graph:, which has been cut
-  at the dependency (!) edges :param cutting_edges:, create a dict of files
-  and module names for files that should be moved into new modules.
+  Using the given :param flow_graph: (created by
+  :func _create_flow_for_cycle_graph:), which has been cut at the dependency
+  (!) edges :param cutting_edges:, create a dict of files that should be moved
+  into new modules.
+
+  The module names are not known by the workers, so the value for every file
+  is the tuple of files the name of its new module is to be generated from.
+  (See :func _name_new_modules:.)
   """
 
   # First, consider the files that are the endpoints of the cutting edges
   # for the move. This is generally a good heuristic as it tends to "break"
   # a lot of cycle chance, e.g. when 20 files depend on a file and one of
   # these dependencies create the cycle.
-  files_to_move = dict(map(lambda e:
-                           (e[1].replace('-> ', '').replace(' ->', ''), None),
-                           cutting_edges))
+  def _file(node):
+    return flow_graph.get_label(node)[1]
+
+  def _dependee(file):
+    return flow_graph.find_node((DEPENDEE, file))
+
+  def _dependency(file):
+    return flow_graph.find_node((DEPENDENCY, file))
+
+  files_to_move = dict(map(lambda e: (_file(e[1]), None), cutting_edges))
   original_files_to_move = sorted(list(files_to_move.keys()))
 
   # However, it could be that a file on the end of the cutting edge is also a
@@ -152,21 +184,17 @@ def _files_from_cutting_edges(module_map, flow_graph, cutting_edges):
   for file in sorted(files_to_move):
     # Iterate copy of the initial files, the dict is modified in the iteration.
     logging.verbose(" ? File candidate for moving: %s" % file)
-    if file + ' ->' in flow_graph.nodes and '-> ' + file in flow_graph.nodes:
+    if _dependee(file) is not None and _dependency(file) is not None:
       # Move the files that are the starting points of edges leading into the
       # previously marked files.
-      try:
-        paths = list(nx.all_shortest_paths(flow_graph,
-                                           file + ' ->',
-                                           '-> ' + file))
-      except nx.NetworkXNoPath:
-        paths = []
+      nodes_on_paths = flow_graph.get_nodes_on_shortest_paths(
+        _dependee(file), _dependency(file))
 
       del files_to_move[file]
       logging.verbose(" ! File cannot be moved: %s" % file)
       cut_candidates = deque(sorted(set(map(
-        lambda e: e[0].replace('-> ', '').replace(' ->', ''),
-        filter(lambda e: file in e[1], cutting_edges)))))
+        lambda e: _file(e[0]),
+        filter(lambda e: _file(e[1]) == file, cutting_edges)))))
 
       # Iterate as long as we have other termini of cutting.
       while cut_candidates:
@@ -175,34 +203,26 @@ def _files_from_cutting_edges(module_map, flow_graph, cutting_edges):
                         % new_move_candidate)
         files_to_move[new_move_candidate] = None
 
-        if '-> ' + new_move_candidate in flow_graph.nodes and \
-              new_move_candidate + ' ->' in flow_graph.nodes:
+        if _dependency(new_move_candidate) is not None and \
+              _dependee(new_move_candidate) is not None:
           # The "source" terminus of the cutting edge leading into a file that
           # is both a dependee and a dependency is *also* both a dependee and
           # a dependency.
           # In this case, the dependency graph cannot be reasonably broken by
           # moving the "source" file either, as the chain would still be there
           # via the new module's name.
-          try:
-            candidates_paths = list(nx.all_shortest_paths(
-              flow_graph,
-              new_move_candidate + ' ->',
-              '-> ' + new_move_candidate))
-          except nx.NetworkXNoPath:
-            candidates_paths = []
-
-          if not any(new_move_candidate + ' ->' in path
-                     for path in paths) \
-                and not any(file + ' ->' in path
-                            for path in candidates_paths):
+          nodes_on_candidates_paths = flow_graph.get_nodes_on_shortest_paths(
+            _dependee(new_move_candidate), _dependency(new_move_candidate))
+
+          if _dependee(new_move_candidate) not in nodes_on_paths \
+                and _dependee(file) not in nodes_on_candidates_paths:
             # If the inner file is also a dependee and a dependency, but the
             # files are not part of the paths between the "dependee" and
             # "dependency" sides of each otherthen put this file into
             # *another* different module.
             # This won't fix the cycles either, but will make the next
             # iteration work with a much smaller graph.
-            files_to_move[new_move_candidate] = mapping.get_new_module_name(
-              module_map, [new_move_candidate])
+            files_to_move[new_move_candidate] = (new_move_candidate,)
           else:
             # The move candidate is part of a path between the insolvent
             # dependency. Try to see if other nodes in the path could be
@@ -218,13 +238,12 @@ def _files_from_cutting_edges(module_map, flow_graph, cutting_edges):
               """
               found_any = False
               for group_in_direction in generator:
-                for file in sorted(group_in_direction):
-                  file = file.replace('-> ', '').replace(' ->', '')
+                for node in sorted(group_in_direction,
+                                   key=partial(_node_name, flow_graph)):
+                  role, file = flow_graph.get_label(node)
 
-                  if not ('-> ' + file
-                          in flow_graph.nodes and file + ' ->'
-                          in flow_graph.nodes) and \
-                        '-> ' + file + ' ->' not in flow_graph.nodes:
+                  if role in (DEPENDEE, DEPENDENCY) and \
+                        None in (_dependency(file), _dependee(file)):
                     # If the found file is not BOTH a dependee and a dependency
                     # (as in that case moving it would yet again just rename
                     # the module in the cycle but won't fix the cycle...), and
@@ -238,10 +257,10 @@ def _files_from_cutting_edges(module_map, flow_graph, cutting_edges):
 
             found_any = _handle_direction(
               graph.transitive_leveled_successors(
-                flow_graph, new_move_candidate + ' ->'))
+                flow_graph, _dependee(new_move_candidate)))
             if not found_any:
               _handle_direction(graph.transitive_leveled_predecessors(
-                flow_graph, '-> ' + new_move_candidate))
+                flow_graph, _dependency(new_move_candidate)))
 
   # Get the files which were marked for moving but no new module name was
   # generated for them yet, and name them to an automatic module name.
@@ -250,17 +269,11 @@ def _files_from_cutting_edges(module_map, flow_graph, cutting_edges):
       lambda e: e[0],
       filter(lambda e: e[1] is None,
              files_to_move.items())))
-  new_module_name = mapping.get_new_module_name(
-    module_map, sorted(files_moving_without_new_module_name))
+  new_module_name = tuple(sorted(files_moving_without_new_module_name))
   for file in files_moving_without_new_module_name:
     files_to_move[file] = new_module_name
 
-  if files_to_move:
-    logging.verbose("Will move the following files to fix the cycle:")
-    if logging.get_configuration()["verbose"]:
-      for file, module in files_to_move.items():
-        logging.verbose("    %s -> %s" % (file, module))
-  else:
+  if not files_to_move:
     if original_files_to_move:
       logging.normal("Run out of candidates. None of the following "
                      "were movable:\n%s"
@@ -272,10 +285,165 @@ def _files_from_cutting_edges(module_map, flow_graph, cutting_edges):
   return files_to_move
 
 
-def _parallel(cycle, module_map, dependency_map):
+def _name_new_modules(module_map, files_to_move):
+  """
+  Generate the names of the new modules in the :param files_to_move: result
+  of :func _files_from_cutting_edges:, using the current :param module_map:.
+  """
+  ret = dict()
+  for file, name_from_files in files_to_move.items():
+    ret[file] = mapping.get_new_module_name(module_map, list(name_from_files))
+
+  if ret:
+    logging.verbose("Will move the following files to fix the cycle:")
+    if logging.get_configuration()["verbose"]:
+      for file, module in ret.items():
+        logging.verbose("    %s -> %s" % (file, module))
+
+  return ret
+
+
+def _extract_cycle_subproblem(cycle, module_map, dependency_map):
+  """
+  Extract the part of :param module_map: and :param dependency_map: that the
+  resolution of :param cycle: needs, so only this has to be sent to the
+  worker, instead of the whole maps.
+
+  :return: The arguments of :func _parallel:: the cycle, the list of files
+  spanning the cycle, and, with files referred to by their index in this
+  list, the "uses" dependency edges between each pair of modules in the cycle
+  (as a flat array of (file, dependency) pairs), and the files of each module.
+  """
+  files = dict()  # (Used as an ordered set.)
+  dependencies = list()
+  for module_A, module_B in zip(cycle, cycle[1:] + cycle[:1]):
+    # (E.g. iterates A -> B, B -> C, C -> A)
+    edges = array('l')
+    between = dependency_map.get_files_creating_dependency_between(module_A,
+                                                                   module_B)
+    for file_in_A, files_in_B in sorted(between.items()):
+      # Cast away the dependency's "kind" value.
+      for file_in_B in sorted(t[0] for t in files_in_B if t[1] == 'uses'):
+        edges.append(files.setdefault(file_in_A, len(files)))
+        edges.append(files.setdefault(file_in_B, len(files)))
+    dependencies.append(edges)
+
+  # Map every file that spans the circular dependency to the module they
+  # belong to.
+  module_files = dict(
+    (module, array('l', map(files.__getitem__, files_of_module)))
+    for module, files_of_module
+    in module_map.filter_modules_for_fragments(files).items())
+
+  return cycle, list(files), dependencies, module_files
+
+
+class _ResolutionCache():
   """
-  The parallel worker part of :func get_circular_dependency_resolution:.
+  Cache of the results of :func _parallel: across the iterations of the
+  split loop, keyed by a hash of the subproblem of the cycle (the files
+  spanning it, the dependencies between them and the modules they belong to).
+
+  The key covers everything the result depends on, so a subproblem that
+  changed (e.g. because one of its files was moved) simply gets a new key, and
+  the entries never have to be invalidated. A subproblem only comes back
+  unchanged if the moves of its last resolution did not break it (e.g. they
+  were overridden by the moves of another cycle), or if the split is looping.
+  Both happen within a few iterations, so only the :param capacity: most
+  recently used entries are kept.
+
+  The number of times the result of each subproblem was handed out to be
+  applied is kept too: if the exact same subproblem comes back (with, by
+  determinism, the same answer) too many times, the split is looping.
   """
+  def __init__(self, capacity):
+    self._capacity = capacity
+    self._results = OrderedDict()
+    self._applied = Counter()
+
+  @staticmethod
+  def key(subproblem):
+    """
+    :return: The key of the subproblem created by
+    :func _extract_cycle_subproblem:.
+    """
+    cycle, files, dependencies, module_files = subproblem
+    digest = md5()
+    digest.update(repr((cycle, files)).encode())
+    for edges in dependencies:
+      digest.update(b'|')
+      digest.update(edges.tobytes())
+    for module, files_of_module in sorted(module_files.items()):
+      digest.update(b'|' + module.encode() + b':')
+      digest.update(files_of_module.tobytes())
+    return digest.hexdigest()
+
+  def __contains__(self, key):
+    return key in self._results
+
+  def get(self, key):
+    self._results.move_to_end(key)
+    return self._results[key]
+
+  def put(self, key, result):
+    self._results[key] = result
+    self._results.move_to_end(key)
+    while len(self._results) > self._capacity:
+      evicted, _ = self._results.popitem(last=False)
+      self._applied.pop(evicted, None)
+
+  def mark_applied(self, key):
+    """
+    Record that the result of the subproblem with :param key: is applied.
+
+    :return: The number of times it was applied so far.
+    """
+    self._applied[key] += 1
+    return self._applied[key]
+
+
+def _files_from_least_coupled_cut(flow, files, dependencies):
+  """
+  A cheap replacement for the minimal cut of :param flow:, used if that
+  cannot be calculated in time: cut every file dependency between the pair of
+  neighbouring modules of the cycle which is created by the fewest edges. If
+  no files can be moved based on that cut, the other pairs are tried, in the
+  order of their coupling. (The arguments are the ones of :func _parallel:.)
+
+  :return: The files to move, in the format of
+  :func _files_from_cutting_edges:, or an empty dict if none of the cuts
+  resulted in files to move.
+  """
+  for _, pair in sorted((len(edges), index)
+                        for index, edges in enumerate(dependencies)
+                        if edges):
+    edges = dependencies[pair]
+    cutting_edges = map(lambda e: (flow.find_node((DEPENDEE, files[e[0]])),
+                                   flow.find_node((DEPENDENCY, files[e[1]]))),
+                        zip(edges[0::2], edges[1::2]))
+    files_to_move = _files_from_cutting_edges(
+      flow, list(filter(lambda e: flow.has_edge(*e), cutting_edges)))
+    if files_to_move:
+      return files_to_move
+
+  return dict()
+
+
+def _parallel(cycle, files, dependencies, module_files,
+              flow_algorithm='builtin', record_directory=None,
+              time_budget=None):
+  """
+  The parallel worker part of :func get_circular_dependency_resolution:. The
+  arguments are the subproblem created by :func _extract_cycle_subproblem:,
+  the algorithm to calculate the minimum cut with, the directory to record
+  the flow network into (if any), and the wall-clock time (in seconds) the
+  minimum cut may take (if limited).
+
+  :return: The files to move (see :func _files_from_cutting_edges:), False if
+  the cycle is infeasible to split, or None if the cycle exceeded the time
+  budget and no files to move were found without the minimal cut.
+  """
+  deadline = time.monotonic() + time_budget if time_budget else None
 
   # Make sure it is "actually" a cycle.
   cycle.append(cycle[0])
@@ -287,31 +455,24 @@ def _parallel(cycle, module_map, dependency_map):
   # Create a graph that contains the files that span the dependencies that
   # resulted in the cycle.
   cycle_file_graph = nx.DiGraph()
-  for module_A, module_B in itertools.zip_longest(cycle[:-1], cycle[1:]):
+  for (module_A, module_B), edges in zip(zip(cycle[:-1], cycle[1:]),
+                                         dependencies):
     # (E.g. iterates A -> B, B -> C, C -> A)
-
     logging.verbose("Between modules %s -> %s, the following files include "
                     "each other:" % (module_A, module_B))
-    files = dependency_map.get_files_creating_dependency_between(module_A,
-                                                                 module_B)
-    for file_in_A, files_in_B in sorted(files.items()):
-      # Cast away the dependency's "kind" value.
-      files[file_in_A] = sorted(t[0] for t in files_in_B if t[1] == 'uses')
-      if not files[file_in_A]:
-        # If the file on the left side (file_in_A) does not participate in
-        # dependency resolution because it doesn't uses-depend on anything,
-        # skip it.
-        continue
-
+    edges = list(zip(map(files.__getitem__, edges[0::2]),
+                     map(files.__getitem__, edges[1::2])))
+    for file_in_A, edges_of_file in itertools.groupby(
+          edges, key=operator.itemgetter(0)):
+      edges_of_file = list(edges_of_file)
       logging.verbose("    %s:" % file_in_A)
-      logging.verbose("        %s" % '\n        '.join(files[file_in_A]))
-      cycle_file_graph.add_edges_from(zip(itertools.repeat(file_in_A),
-                                          files[file_in_A]))
+      logging.verbose("        %s" % '\n        '.join(
+        map(operator.itemgetter(1), edges_of_file)))
+      cycle_file_graph.add_edges_from(edges_of_file)
 
-  # Map every file that spans the circular dependency to the module they
-  # belong to.
-  module_to_files_map = module_map.filter_modules_for_fragments(
-    cycle_file_graph.nodes)
+  module_to_files_map = dict(
+    (module, list(map(files.__getitem__, files_of_module)))
+    for module, files_of_module in module_files.items())
 
   graph_visualisation('dependencies').draw_dependency_graph(
     cycle_file_graph, module_to_files_map)
@@ -320,32 +481,54 @@ def _parallel(cycle, module_map, dependency_map):
   flow = _create_flow_for_cycle_graph(cycle, cycle_file_graph,
                                       module_to_files_map)
 
+  if record_directory:
+    _record_flow(record_directory, cycle, flow)
+
   # Calculate the minimal cut on the built flow-graph.
-  cut_value, partition = nx.minimum_cut(flow,
-                                        cycle[0] + ' ->',
-                                        '-> ' + cycle[0])
-
-  graph_visualisation('cuts').draw_flow_and_cut(
-    flow, cycle_file_graph, module_to_files_map, cycle[0], partition)
-  graph_visualisation('cuts').show()  # Blocking call!
-
-  # Create edges from the file dependency graph in which the edge
-  # endpoints show the "direction" of the edge. (Partition contains edges
-  # between nodes named as such.)
-  cycle_file_graph_edges_namedirected = map(lambda e: (e[0] + ' ->',
-                                                       '-> ' + e[1]),
-                                            cycle_file_graph.edges)
-  cycle_file_graph_edges_namedirected = filter(
-    lambda e: e in flow.edges, cycle_file_graph_edges_namedirected)
+  try:
+    cut_value, partition = minimum_cut(flow,
+                                       flow.find_node((SOURCE, cycle[0])),
+                                       flow.find_node((SINK, cycle[0])),
+                                       flow_algorithm,
+                                       deadline)
+  except TimeoutError:
+    logging.essential("Cycle exceeded the time budget of %g seconds, cutting "
+                      "its least coupled dependency instead:\n    %s"
+                      % (time_budget, ' -> '.join(cycle)),
+                      file=sys.stderr)
+    files_to_move = _files_from_least_coupled_cut(flow, files, dependencies)
+    if not files_to_move:
+      # Running out of time does not mean the cycle is infeasible to split,
+      # so it is only skipped in this iteration.
+      logging.essential("No files to move were found without the minimal "
+                        "cut, skipping the cycle in this iteration:\n    %s"
+                        % ' -> '.join(cycle),
+                        file=sys.stderr)
+      return None
+    return files_to_move
+
+  if graph_visualisation_enabled('cuts'):
+    node_name = partial(_node_name, flow)
+    graph_visualisation('cuts').draw_flow_and_cut(
+      flow.to_networkx(node_name), cycle_file_graph, module_to_files_map,
+      cycle[0], [set(map(node_name, side)) for side in partition])
+    graph_visualisation('cuts').show()  # Blocking call!
+
+  # Create edges from the file dependency graph between the nodes that
+  # show the "direction" of the edge. (Partition contains these nodes.)
+  cycle_file_graph_edges_directed = map(
+    lambda e: (flow.find_node((DEPENDEE, e[0])),
+               flow.find_node((DEPENDENCY, e[1]))),
+    cycle_file_graph.edges)
+  cycle_file_graph_edges_directed = filter(
+    lambda e: flow.has_edge(*e), cycle_file_graph_edges_directed)
 
   cutting_edges = list(
-    graph.generate_cutting_edges(cycle_file_graph_edges_namedirected,
+    graph.generate_cutting_edges(cycle_file_graph_edges_directed,
                                  partition))
 
   # Try fetching the list of files to move based on the cut.
-  files_to_move = _files_from_cutting_edges(module_map,
-                                            flow,
-                                            cutting_edges)
+  files_to_move = _files_from_cutting_edges(flow, cutting_edges)
 
   if not files_to_move:
     # If files_to_move is a falsy value, like empty set, the cycle is
@@ -358,11 +541,35 @@ def _parallel(cycle, module_map, dependency_map):
     return files_to_move
 
 
+def _estimate_size(subproblem):
+  """
+  :return: The estimated size of the flow network of the subproblem created
+  by :func _extract_cycle_subproblem:: the number of its files and
+  dependencies.
+  """
+  _, files, dependencies, _ = subproblem
+  return len(files) + sum(len(edges) for edges in dependencies) // 2
+
+
+def _parallel_indexed(job):
+  """
+  Run :func _parallel: with the arguments of the (index, arguments)
+  :param job:, returning the index along with the result.
+  """
+  index, args = job
+  return index, _parallel(*args)
+
+
 def get_circular_dependency_resolution(iteration_pingpong_buffer,
                                        iteration_pingpong_threshold,
                                        pool,
                                        module_map,
-                                       dependency_map):
+                                       dependency_map,
+                                       module_graph=None,
+                                       flow_algorithm='builtin',
+                                       record_directory=None,
+                                       resolution_cache=None,
+                                       time_budget=None):
   """
   Checks if the given :param module_map: and :param dependency_map: (which is
   created bound to the :param module_map:) contain circular dependencies on
@@ -377,6 +584,24 @@ def get_circular_dependency_resolution(iteration_pingpong_buffer,
   should be executed. Individual cycles can be resolved in an parallel manner,
   as resolution is only calculated, and not applied to the shared resources.
 
+  :param module_graph: A :type ModuleGraph: observing :param module_map:,
+  which is used to find the cycles. If not given, the cycles are searched in
+  the whole module map.
+
+  :param flow_algorithm: The algorithm (see :var utils.flow.FLOW_ALGORITHMS:)
+  used to calculate the minimal cuts of the cycles.
+
+  :param record_directory: If given, the flow networks of the cycles are
+  saved into this directory, for benchmarking.
+
+  :param resolution_cache: A :type _ResolutionCache: kept across the calls,
+  which stores the resolution of the cycles that are found again.
+
+  :param time_budget: The wall-clock time (in seconds) the minimal cut of a
+  cycle may take, after which a cheaper heuristic cut is used. If not given,
+  the time is not limited. If neither finds files to move for any of the
+  cycles in time, :type TimeoutError: is raised.
+
   :return: A map of files to new module names to be moved to resolve the
   dependency. The map is empty if no cycles were found.
   """
@@ -391,9 +616,13 @@ def get_circular_dependency_resolution(iteration_pingpong_buffer,
             # so the order is deterministic.
             sorted(module_map.get_dependencies_of_module(module)))
 
-  dependencies = dict(map(_map_to_dependencies, module_map))
-  shortest_cycle_length, minimum_long_cycles = graph.simple_cycles(
-      dependencies)
+  if module_graph is not None:
+    shortest_cycle_length, minimum_long_cycles = \
+      module_graph.get_shortest_cycles()
+  else:
+    dependencies = dict(map(_map_to_dependencies, module_map))
+    shortest_cycle_length, minimum_long_cycles = graph.simple_cycles(
+        dependencies)
   # minimum_long_cycles return a dict(Node, [Node, Node2, Node3, ..., Node])
   # format, associating each module with an edge that contains the associated
   # edge both as a prefix and a suffix. Cut this out to a simple
@@ -425,15 +654,76 @@ def get_circular_dependency_resolution(iteration_pingpong_buffer,
   logging.normal("Found %d smallest cycles of length %d between modules."
                  % (len(cycles), shortest_cycle_length))
 
-  args = zip(cycles,
-             itertools.repeat(module_map),
-             itertools.repeat(dependency_map))
+  # Only the part of the maps needed for resolving a cycle is sent to the
+  # worker resolving it.
+  subproblems = [_extract_cycle_subproblem(cycle, module_map, dependency_map)
+                 for cycle in cycles]
+  keys = list(map(_ResolutionCache.key, subproblems)) \
+    if resolution_cache is not None else [None] * len(subproblems)
+
+  # The subproblems that were already solved exactly the same way in a
+  # previous iteration are not solved again.
+  unsolved = [index for index, key in enumerate(keys)
+              if key is None or key not in resolution_cache]
+  if len(unsolved) != len(subproblems):
+    logging.normal("Reusing the resolution of %d cycles from earlier "
+                   "iterations." % (len(subproblems) - len(unsolved)))
+
+  # Hand out the largest subproblems first, one at a time, so a big cycle
+  # does not start last (or get chunked together with others) and keep the
+  # whole iteration waiting for it.
+  unsolved.sort(key=lambda index: (-_estimate_size(subproblems[index]),
+                                   index))
+  results = dict(pool.imap_unordered(
+    _parallel_indexed,
+    [(index, subproblems[index] + (flow_algorithm, record_directory,
+                                   time_budget))
+     for index in unsolved]))
 
   ret = dict()
-  for result in pool.starmap(_parallel, args):
-    if result is False:
-      return False
-    ret.update(result)
+  repeated_subproblem = None
+  timed_out_cycles = list()
+  for index, (subproblem, key) in enumerate(zip(subproblems, keys)):
+    if index in results:
+      result = results[index]
+      if result is False:
+        return False
+      if result is None:
+        # (The cycle ran out of time, it is retried in the next iteration.)
+        timed_out_cycles.append(subproblem[0])
+        continue
+      if key is not None:
+        resolution_cache.put(key, result)
+    else:
+      result = resolution_cache.get(key)
+
+    if key is not None and \
+          resolution_cache.mark_applied(key) > iteration_pingpong_threshold:
+      repeated_subproblem = subproblem[0]
+    ret.update(_name_new_modules(module_map, result))
+
+  if repeated_subproblem is not None:
+    # The exact same subproblem was solved to the exact same answer too many
+    # times: the moves keep on restoring the same state.
+    logging.essential("Error! The cycle was resolved with the same moves of "
+                      "the same files more than %d times.\nConsidering the "
+                      "algorithm to have stuck in a loop!\n    %s"
+                      % (iteration_pingpong_threshold,
+                         " -> ".join(repeated_subproblem)),
+                      file=sys.stderr)
+    raise RecursionError()
+
+  if len(timed_out_cycles) == len(subproblems):
+    # Nothing was moved, so the next iteration would find the same cycles and
+    # run out of time on them again.
+    logging.essential("Error! The time budget of %g seconds was exhausted "
+                      "for every cycle, without finding files to move:\n%s"
+                      "\nConsider increasing '--cycle-split-time-budget'."
+                      % (time_budget,
+                         '\n'.join("    " + " -> ".join(cycle)
+                                   for cycle in timed_out_cycles)),
+                      file=sys.stderr)
+    raise TimeoutError()
 
   if iteration_pingpong_buffer:
     iteration_pingpong_check = next(iter(Counter(iteration_pingpong_buffer)
@@ -462,7 +752,8 @@ def get_circular_dependency_resolution(iteration_pingpong_buffer,
 
 
 def main(MODULE_MAP, DEPENDENCY_MAP,
-         THREAD_COUNT, MODULE_SPLIT_PINGPONG_THRESHOLD):
+         EXECUTOR, MODULE_SPLIT_PINGPONG_THRESHOLD,
+         FLOW_ALGORITHM, FLOW_RECORD_DIRECTORY, CYCLE_SPLIT_TIME_BUDGET):
   # Make sure the module-to-module import directives are in the dependency map,
   # as this stage operates based on them.
   DEPENDENCY_MAP.synthesize_intermodule_imports()
@@ -476,40 +767,49 @@ def main(MODULE_MAP, DEPENDENCY_MAP,
   # units -- unfortunately there was no improvement on modularisation made in
   # this case...
   iteration_count = 1
-  with multiprocessing.Pool(THREAD_COUNT) as pool:
-    while True:
-      logging.essential(
-        "========->> Begin iteration %d trying to break cycles.. <<-========"
-        % iteration_count)
-      module_count = len(MODULE_MAP)
-      logging.normal("... Searching for cycles between %d modules ..."
-                     % module_count)
-
-      files_to_move = get_circular_dependency_resolution(
-        pingpong_buffer, MODULE_SPLIT_PINGPONG_THRESHOLD,
-        pool, MODULE_MAP, DEPENDENCY_MAP)
-      if files_to_move is False:
-        logging.essential("Error! The modules contain circular dependencies "
-                          "on each other which cannot be resolved "
-                          "automatically by splitting them.",
-                          file=sys.stderr)
-        sys.exit(1)
-      elif files_to_move is True:
-        # If the resolution of the cycles is to do nothing, there are no issues
-        # with the mapping anymore.
-        logging.normal("Nothing to do.")
-        break
-      else:
-        # Alter the module map with the calculated moves, and try running the
-        # iteration again.
-        mapping.apply_file_moves(MODULE_MAP, DEPENDENCY_MAP, files_to_move)
-
-      if len(MODULE_MAP) != module_count:
-        # The number of modules have changed, so the iteration must have
-        # progressed. Wipe the infinite pingpong loop buffer in this case, so
-        # actual forward progress is not considered an infinite cycle.
-        pingpong_buffer.clear()
-
-      iteration_count += 1
+  # The graph of the imports is kept up to date as the files are moved, so
+  # the cycles are only searched again in the parts that changed.
+  module_graph = ModuleGraph(MODULE_MAP)
+  # (The cache remembers as many resolutions as cycles are looked back at to
+  # detect the loops.)
+  resolution_cache = _ResolutionCache(pingpong_buffer.maxlen)
+  pool = EXECUTOR.process_pool
+  while True:
+    logging.essential(
+      "========->> Begin iteration %d trying to break cycles.. <<-========"
+      % iteration_count)
+    module_count = len(MODULE_MAP)
+    logging.normal("... Searching for cycles between %d modules ..."
+                   % module_count)
+
+    files_to_move = get_circular_dependency_resolution(
+      pingpong_buffer, MODULE_SPLIT_PINGPONG_THRESHOLD,
+      pool, MODULE_MAP, DEPENDENCY_MAP, module_graph,
+      FLOW_ALGORITHM, FLOW_RECORD_DIRECTORY, resolution_cache,
+      CYCLE_SPLIT_TIME_BUDGET)
+    if files_to_move is False:
+      logging.essential("Error! The modules contain circular dependencies "
+                        "on each other which cannot be resolved "
+                        "automatically by splitting them.",
+                        file=sys.stderr)
+      sys.exit(1)
+    elif files_to_move is True:
+      # If the resolution of the cycles is to do nothing, there are no issues
+      # with the mapping anymore.
+      logging.normal("Nothing to do.")
+      break
+    else:
+      # Alter the module map with the calculated moves, and try running the
+      # iteration again.
+      mapping.apply_file_moves(MODULE_MAP, DEPENDENCY_MAP, files_to_move)
+
+    if len(MODULE_MAP) != module_count:
+      # The number of modules have changed, so the iteration must have
+      # progressed. Wipe the infinite pingpong loop buffer in this case, so
+      # actual forward progress is not considered an infinite cycle.
+      pingpong_buffer.clear()
+
+    iteration_count += 1
 
+  module_graph.detach()
   mapping.fix_module_names(MODULE_MAP, DEPENDENCY_MAP)
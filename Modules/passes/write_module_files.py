@@ -9,8 +9,11 @@ DESCRIPTION = "Write Modules TS declaration (CPPM) files"
 
 
 def main(START_FOLDER,
+         THREAD_COUNT,
+         EXECUTOR,
          MODULE_MAP,
          DEPENDENCY_MAP,
+         FILE_CATALOG,
          HEADER_FILE_REGEX,
          EXTERNAL_INCLUDE_GRAPH):
   # Make sure the module-to-module import directives are in the dependency map,
@@ -19,7 +22,8 @@ def main(START_FOLDER,
 
   # After the modules has been split up, commit the changes to the file system
   # for the upcoming operations.
-  mapping.write_module_mapping(START_FOLDER, MODULE_MAP)
+  mapping.write_module_mapping(START_FOLDER, MODULE_MAP, THREAD_COUNT,
+                               EXECUTOR.thread_pool)
 
   # Files can transitively and with the employment of header guards,
   # recursively include each other, which is not a problem in normal C++,
@@ -30,11 +34,19 @@ def main(START_FOLDER,
   # a good order.
   topological_success = True
   non_topological_files = list()
+  # Only the part of the (project-wide) include graph which is relevant for
+  # a module is used when sorting it.
+  include_projections = mapping.get_module_include_projections(
+    EXTERNAL_INCLUDE_GRAPH, MODULE_MAP)
+  # (The modules are sorted one after the other, not on the EXECUTOR: the
+  # sorting is pure Python work on the shared graphs, which the threads would
+  # only take turns on, and which would have to be pickled for every module
+  # to the processes. The warnings about the cycles are kept in order, too.)
   for module in tqdm(sorted(MODULE_MAP),
                      desc="Sorting files",
                      unit='module'):
     files_in_module = MODULE_MAP.get_fragment_list(module)
-    headers_in_module = filter(HEADER_FILE_REGEX.search, files_in_module)
+    headers_in_module = filter(FILE_CATALOG.is_header, files_in_module)
 
     # By default, put every file known to be mapped into the module into
     # the list. (But they are not marked to have any dependencies.)
@@ -42,13 +54,13 @@ def main(START_FOLDER,
                                         headers_in_module))
     # Then add the list of known dependencies from the previous built map.
     for dependee_file, dep_pair in \
-          filter(lambda e: HEADER_FILE_REGEX.search(e[0]),
+          filter(lambda e: FILE_CATALOG.is_header(e[0]),
                  DEPENDENCY_MAP.get_intramodule_dependencies(module).items()):
       dep_list = list()
       for tupl in dep_pair:
         # Remove the "kind" attribute from the dependency graph for this.
         filename, kind = tupl
-        if kind == 'uses' and HEADER_FILE_REGEX.search(filename):
+        if kind == 'uses' and FILE_CATALOG.is_header(filename):
           dep_list.append(filename)
       if dep_list:
         # Only save the dependency into this dict if the file partook in any
@@ -59,7 +71,8 @@ def main(START_FOLDER,
       MODULE_MAP.get_filename(module),
       HEADER_FILE_REGEX,
       EXTERNAL_INCLUDE_GRAPH,
-      intramodule_dependencies)
+      intramodule_dependencies,
+      include_projections[module])
     if type(module_success_or_non_topo_files) is list:
         non_topological_files.extend(module_success_or_non_topo_files)
         module_success_or_non_topo_files = True
@@ -9,6 +9,7 @@ import sys
 import time
 
 from ModulesTSMaker import mapping
+from utils.discovery import DEFAULT_EXCLUDED_DIRECTORIES
 from utils.progress_bar import tqdm
 
 # ------------------- Set up the command-line configuration -------------------
@@ -29,6 +30,22 @@ PARSER.add_argument("num_buckets",
                     help="The number of modules to group the found original "
                          "modules into.")
 
+PARSER.add_argument("--exclude-dir",
+                    dest='excluded_directories',
+                    action='append',
+                    metavar="DIRECTORY",
+                    help="Name of directories that are not searched for "
+                         "module files. Can be specified multiple times. "
+                         "(Default: %s)"
+                         % ', '.join(DEFAULT_EXCLUDED_DIRECTORIES))
+
+PARSER.add_argument("--no-gitignore",
+                    dest='use_gitignore',
+                    action='store_false',
+                    help="Search module files even in the files and "
+                         "directories ignored by the '.gitignore' files of "
+                         "the project.")
+
 ARGS = PARSER.parse_args()
 
 if ARGS.num_buckets <= 0:
@@ -44,7 +61,10 @@ START_AT = time.time()
 # First, load all the modules in the current tree and build a data structure as
 # to where and what they are.
 
-ModuleMap, _ = mapping.get_module_mapping(ARGS.project_dir)
+ModuleMap, _ = mapping.get_module_mapping(ARGS.project_dir,
+                                          excluded_directories=ARGS
+                                          .excluded_directories,
+                                          use_gitignore=ARGS.use_gitignore)
 
 buckets = [list() for _ in range(ARGS.num_buckets)]
 
@@ -136,7 +156,8 @@ for i, bucket in enumerate(tqdm(buckets,
             for fragment in ModuleMap.get_fragment_list(module):
                 print("#include \"%s\"" % fragment, file=out)
 
-            os.remove(ModuleMap.get_filename(module))
+            os.remove(os.path.join(ARGS.project_dir,
+                                   ModuleMap.get_filename(module)))
 
 END_AT = time.time()
 
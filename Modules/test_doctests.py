@@ -0,0 +1,23 @@
+"""
+Run the examples in the docstrings of the modules of the tool as tests:
+
+    python3 -m unittest test_doctests
+
+(The modules are imported from their packages, so this must be run from the
+folder of this file.)
+"""
+
+import doctest
+import importlib
+
+MODULES = ['ModulesTSMaker.include',
+           'ModulesTSMaker.module_graph',
+           'ModulesTSMaker.util',
+           'utils.discovery',
+           'utils.flow']
+
+
+def load_tests(loader, tests, ignore):
+  for module in MODULES:
+    tests.addTests(doctest.DocTestSuite(importlib.import_module(module)))
+  return tests
@@ -1,12 +1,17 @@
 import codecs
 import os
+import stat
 import subprocess
 import sys
+import uuid
+from hashlib import md5
 from itertools import filterfalse, tee
 
 from . import logging
 
-__all__ = ['graph',
+__all__ = ['discovery',
+           'executor',
+           'graph',
            'graph_visualisation',
            'logging',
            'progress_bar']
@@ -105,6 +110,42 @@ def replace_at_position(filename, line, col, from_str, to_str):
     return False
 
 
+def write_file_if_changed(filename, contents):
+  """
+  Write the string :param contents: into :param filename:, unless the file
+  already has the same contents, in which case the file (and its modification
+  time) is left untouched. The file is replaced atomically, so readers of the
+  file never see it partially written.
+
+  :return: True if the file was written, False if it was unchanged.
+  """
+  data = contents.encode('utf-8')
+  try:
+    with open(filename, 'rb') as handle:
+      if md5(handle.read()).digest() == md5(data).digest():
+        return False
+      mode = stat.S_IMODE(os.fstat(handle.fileno()).st_mode)
+  except OSError:
+    # (A new file gets the permissions the umask of the process allows.)
+    mode = None
+
+  temp_filename = os.path.join(
+    os.path.dirname(os.path.abspath(filename)),
+    '.%s.%s' % (os.path.basename(filename), uuid.uuid4().hex))
+  fd = os.open(temp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+  try:
+    with os.fdopen(fd, 'wb') as handle:
+      handle.write(data)
+    if mode is not None:
+      os.chmod(temp_filename, mode)
+    os.replace(temp_filename, filename)
+  except BaseException:
+    os.unlink(temp_filename)
+    raise
+
+  return True
+
+
 def append_to_dict_element(Dict, key, value,
                            default_value=None,
                            append_method=list.__iadd__):
@@ -0,0 +1,178 @@
+import os
+from fnmatch import fnmatchcase
+
+# Directories that never contain the project's own source files, and are
+# skipped when searching the source tree.
+DEFAULT_EXCLUDED_DIRECTORIES = ['.git', '.hg', '.svn', 'build',
+                                '__pycache__']
+
+
+class GitIgnoreRules():
+  """
+  The rules of the '.gitignore' files found while walking a directory tree.
+
+  The commonly used subset of the format is supported: comments, negated
+  ('!') patterns, directory-only ('/'-suffixed) patterns and patterns anchored
+  to the directory of the '.gitignore' file.
+  """
+  def __init__(self, rules=None):
+    # Every rule is a (base directory, pattern, negated, directory-only,
+    # anchored) tuple, in the order they were read.
+    self._rules = list(rules) if rules else list()
+
+  def extend_from(self, directory, relative_directory):
+    """
+    :return: A new :type GitIgnoreRules: with the rules of the '.gitignore'
+    file in :param directory: appended to the current ones, or the current
+    instance if there is no such file.
+    """
+    try:
+      with open(os.path.join(directory, '.gitignore'), 'r',
+                errors='replace') as handle:
+        lines = handle.readlines()
+    except OSError:
+      return self
+
+    rules = list()
+    for line in lines:
+      line = line.rstrip('\n').rstrip()
+      if not line or line.startswith('#'):
+        continue
+
+      negated = line.startswith('!')
+      if negated:
+        line = line[1:]
+      directory_only = line.endswith('/')
+      line = line.rstrip('/')
+      anchored = '/' in line
+      line = line.lstrip('/')
+      if line:
+        rules.append((relative_directory, line, negated, directory_only,
+                      anchored))
+
+    if not rules:
+      return self
+    return GitIgnoreRules(self._rules + rules)
+
+  def is_ignored(self, relative_path, is_directory):
+    """
+    :return: If the file or directory at :param relative_path: (relative to
+    the root of the walk) is ignored. The last matching rule decides.
+
+    >>> import tempfile
+    >>> root = tempfile.mkdtemp()
+    >>> os.mkdir(os.path.join(root, 'src'))
+    >>> with open(os.path.join(root, '.gitignore'), 'w') as handle:
+    ...   print("# Objects", "*.o", "!keep.o", "out/", "/config.h",
+    ...         sep="\\n", file=handle)
+    >>> with open(os.path.join(root, 'src', '.gitignore'), 'w') as handle:
+    ...   print("/local.h", "gen/*.h", sep="\\n", file=handle)
+    >>> rules = GitIgnoreRules().extend_from(root, '')
+    >>> rules = rules.extend_from(os.path.join(root, 'src'), 'src')
+
+    >>> rules.is_ignored('src/main.o', False)
+    True
+    >>> rules.is_ignored('src/keep.o', False)
+    False
+    >>> rules.is_ignored('src/out', True), rules.is_ignored('src/out', False)
+    (True, False)
+    >>> rules.is_ignored('config.h', False)
+    True
+    >>> rules.is_ignored('src/config.h', False)
+    False
+    >>> rules.is_ignored('src/local.h', False)
+    True
+    >>> rules.is_ignored('local.h', False)
+    False
+    >>> rules.is_ignored('src/x/local.h', False)
+    False
+    >>> rules.is_ignored('src/gen/a.h', False)
+    True
+    >>> rules.is_ignored('gen/a.h', False)
+    False
+
+    >>> import shutil
+    >>> shutil.rmtree(root)
+    """
+    ignored = False
+    for base, pattern, negated, directory_only, anchored in self._rules:
+      if directory_only and not is_directory:
+        continue
+      if base:
+        if not relative_path.startswith(base + '/'):
+          continue
+        path = relative_path[len(base) + 1:]
+      else:
+        path = relative_path
+
+      if not anchored:
+        path = path.rsplit('/', 1)[-1]
+      if fnmatchcase(path, pattern):
+        ignored = not negated
+
+    return ignored
+
+
+def find_files(folder, extension, excluded_directories=None,
+               use_gitignore=True):
+  """
+  Yields the files with :param extension: in :param folder:, relative to the
+  folder, in the format of :func utils.walk_folder:.
+
+  The directories named in :param excluded_directories: (by default,
+  :var DEFAULT_EXCLUDED_DIRECTORIES:) are not entered. If
+  :param use_gitignore: is set, the files and directories ignored by the
+  '.gitignore' files of the tree are skipped too.
+
+  >>> import tempfile
+  >>> root = tempfile.mkdtemp()
+  >>> for path in ['a.cppm', 'a.h', 'build/b.cppm', 'lib/c.cppm',
+  ...              'lib/tmp/d.cppm', 'lib/z/e.cppm']:
+  ...   os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+  ...   open(os.path.join(root, path), 'w').close()
+  >>> with open(os.path.join(root, 'lib', '.gitignore'), 'w') as handle:
+  ...   print("tmp/", file=handle)
+  >>> list(find_files(root, '.cppm'))
+  ['a.cppm', 'lib/c.cppm', 'lib/z/e.cppm']
+  >>> list(find_files(root, '.cppm', ['z'], use_gitignore=False))
+  ['a.cppm', 'build/b.cppm', 'lib/c.cppm', 'lib/tmp/d.cppm']
+
+  >>> import shutil
+  >>> shutil.rmtree(root)
+  """
+  if excluded_directories is None:
+    excluded_directories = DEFAULT_EXCLUDED_DIRECTORIES
+  excluded_directories = set(excluded_directories)
+
+  work_list = [('', GitIgnoreRules())]
+  while work_list:
+    relative_directory, rules = work_list.pop()
+    directory = os.path.join(folder, relative_directory)
+    if use_gitignore:
+      rules = rules.extend_from(directory, relative_directory)
+
+    try:
+      with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    except OSError:
+      continue
+
+    subdirectories = list()
+    for entry in entries:
+      relative_path = os.path.join(relative_directory, entry.name)
+      if entry.is_dir(follow_symlinks=False):
+        if entry.name in excluded_directories:
+          continue
+        if use_gitignore and rules.is_ignored(relative_path, True):
+          continue
+        subdirectories.append((relative_path, rules))
+        continue
+
+      if not entry.name.endswith(extension):
+        continue
+      if use_gitignore and rules.is_ignored(relative_path, False):
+        continue
+      yield relative_path
+
+    # (Visit the subdirectories in alphabetical order.)
+    work_list.extend(reversed(subdirectories))
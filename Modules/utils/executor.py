@@ -0,0 +1,58 @@
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+
+class ExecutorService():
+  """
+  The worker pools shared by the passes of the tool, so every pass can fan
+  out its independent work without paying the start-up cost of its own pool.
+
+  The process pool is meant for CPU-bound work (the arguments and results are
+  pickled to and from the workers), the thread pool for I/O-bound work on the
+  shared state. Both have :param jobs: workers, and are only started when they
+  are first used.
+  """
+  def __init__(self, jobs=None):
+    self._jobs = jobs
+    self._process_pool = None
+    self._thread_pool = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.shutdown()
+
+  @property
+  def jobs(self):
+    return self._jobs
+
+  @property
+  def process_pool(self):
+    """
+    :return: The :type multiprocessing.Pool: of the service.
+    """
+    if self._process_pool is None:
+      self._process_pool = multiprocessing.Pool(self._jobs)
+    return self._process_pool
+
+  @property
+  def thread_pool(self):
+    """
+    :return: The :type multiprocessing.pool.ThreadPool: of the service.
+    """
+    if self._thread_pool is None:
+      self._thread_pool = ThreadPool(self._jobs)
+    return self._thread_pool
+
+  def shutdown(self):
+    """
+    Stop the pools that were started. They are started again if they are used
+    after this.
+    """
+    for pool in (self._process_pool, self._thread_pool):
+      if pool is not None:
+        pool.terminate()
+        pool.join()
+    self._process_pool = None
+    self._thread_pool = None
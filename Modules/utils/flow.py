@@ -0,0 +1,374 @@
+import signal
+import threading
+import time
+from array import array
+from collections import deque
+from contextlib import contextmanager
+
+try:
+  import networkx as nx
+  from networkx.algorithms import flow as nx_flow
+except ImportError as e:
+  print("Error! A dependency of this tool could not be satisfied. Please "
+        "install the following Python package via 'pip' either to the "
+        "system, or preferably create a virtualenv.")
+  raise
+
+# The algorithms that can calculate the minimum cut of a :type FlowNetwork:.
+# 'builtin' is the array-based implementation of the network itself, the
+# others are run by networkx on a copy of the network.
+FLOW_ALGORITHMS = {'builtin': None,
+                   'preflow-push': nx_flow.preflow_push,
+                   'dinic': nx_flow.dinitz,
+                   'boykov-kolmogorov': nx_flow.boykov_kolmogorov,
+                   'edmonds-karp': nx_flow.edmonds_karp}
+
+
+class FlowNetwork():
+  """
+  A directed flow network over integer nodes, stored in arrays.
+
+  Every node is identified by its index (in the order of creation), and has a
+  label, which is an arbitrary hashable object given by the user. Every edge
+  is stored as a pair of arcs: the arc of the edge itself (with an even
+  index), and its reverse arc (with the next, odd index), which only carries
+  the residual capacity of the edge during the flow calculation.
+
+  An edge without a capacity has infinite capacity.
+  """
+  def __init__(self):
+    self._labels = list()
+    self._ids = dict()
+
+    # node -> list of the arcs leaving the node, in the order of creation.
+    self._adjacency = list()
+    # arc -> the node the arc points to.
+    self._heads = array('l')
+    # arc -> capacity of the arc, -1 for infinite.
+    self._capacities = array('q')
+    # (u, v) -> the arc of the (u, v) edge.
+    self._arcs = dict()
+
+  def __len__(self):
+    return len(self._labels)
+
+  def __contains__(self, label):
+    return label in self._ids
+
+  def add_node(self, label):
+    """
+    :return: The node with :param label:. The node is created if it does not
+    exist yet.
+    """
+    node = self._ids.get(label, None)
+    if node is None:
+      node = len(self._labels)
+      self._ids[label] = node
+      self._labels.append(label)
+      self._adjacency.append(list())
+    return node
+
+  def find_node(self, label):
+    """
+    :return: The node with :param label:, or None if there is no such node.
+    """
+    return self._ids.get(label, None)
+
+  def get_label(self, node):
+    return self._labels[node]
+
+  def add_edge(self, u, v, capacity=None):
+    """
+    Add the (u, v) edge with :param capacity: (infinite if not given) to the
+    network. If the edge exists already, its capacity is overwritten.
+    """
+    capacity = -1 if capacity is None else capacity
+    arc = self._arcs.get((u, v), None)
+    if arc is not None:
+      self._capacities[arc] = capacity
+      return
+
+    arc = len(self._heads)
+    self._arcs[(u, v)] = arc
+    self._heads.extend((v, u))
+    self._capacities.extend((capacity, 0))
+    self._adjacency[u].append(arc)
+    self._adjacency[v].append(arc + 1)
+
+  def has_edge(self, u, v):
+    return (u, v) in self._arcs
+
+  def get_capacity(self, u, v):
+    """
+    :return: The capacity of the (u, v) edge, or None if it is infinite.
+    """
+    capacity = self._capacities[self._arcs[(u, v)]]
+    return capacity if capacity >= 0 else None
+
+  def edges(self):
+    """
+    Generate the (u, v) edges of the network, in the order of creation.
+    """
+    return iter(self._arcs)
+
+  def to_networkx(self, node_name=None):
+    """
+    :return: A copy of the network as an :type nx.DiGraph:, with a 'capacity'
+    attribute on the edges with finite capacity. The nodes are named by
+    :param node_name: called with the node, or the node itself if not given.
+    """
+    names = list(map(node_name, range(len(self._labels)))) \
+      if node_name else range(len(self._labels))
+
+    graph = nx.DiGraph()
+    graph.add_nodes_from(names)
+    for (u, v), arc in self._arcs.items():
+      if self._capacities[arc] >= 0:
+        graph.add_edge(names[u], names[v], capacity=self._capacities[arc])
+      else:
+        graph.add_edge(names[u], names[v])
+    return graph
+
+  def successors(self, node):
+    return [self._heads[arc] for arc in self._adjacency[node]
+            if not arc & 1]
+
+  def predecessors(self, node):
+    return [self._heads[arc] for arc in self._adjacency[node] if arc & 1]
+
+  def _distances(self, start, forward):
+    """
+    :return: The list of the (unweighted) distances of the nodes from
+    :param start: (or to it, if :param forward: is False), -1 for the nodes
+    that are not reachable.
+    """
+    distances = [-1] * len(self._labels)
+    distances[start] = 0
+    queue = deque([start])
+    while queue:
+      node = queue.popleft()
+      for arc in self._adjacency[node]:
+        if (arc & 1) == forward:
+          continue
+        head = self._heads[arc]
+        if distances[head] < 0:
+          distances[head] = distances[node] + 1
+          queue.append(head)
+    return distances
+
+  def get_nodes_on_shortest_paths(self, source, target):
+    """
+    :return: The set of nodes which are on any (unweighted) shortest path
+    from :param source: to :param target:, or an empty set if
+    :param target: is not reachable.
+    """
+    from_source = self._distances(source, True)
+    length = from_source[target]
+    if length < 0:
+      return set()
+
+    to_target = self._distances(target, False)
+    ret = set()
+    for node in range(len(self._labels)):
+      if from_source[node] >= 0 and to_target[node] >= 0 and \
+            from_source[node] + to_target[node] == length:
+        ret.add(node)
+    return ret
+
+  def minimum_cut(self, source, sink, deadline=None):
+    """
+    Calculate the maximum flow from :param source: to :param sink: with
+    Dinic's algorithm, and a minimum cut of the network.
+
+    If :param deadline: (in the time of :func time.monotonic:) is given and
+    passes before the flow is found, :type TimeoutError: is raised.
+
+    :return: (cut_value, (S, T)), where T is the set of nodes from which
+    :param sink: is reachable in the residual network of the maximum flow,
+    and S is the set of the other nodes.
+
+    >>> network = FlowNetwork()
+    >>> s, a, b, t = map(network.add_node, 'sabt')
+    >>> network.add_edge(s, a, 3)
+    >>> network.add_edge(s, b, 1)
+    >>> network.add_edge(a, b)
+    >>> network.add_edge(a, t, 1)
+    >>> network.add_edge(b, t, 2)
+    >>> network.minimum_cut(s, t)
+    (3, ({0, 1, 2}, {3}))
+
+    >>> network.add_edge(b, t, 10)
+    >>> network.minimum_cut(s, t)
+    (4, ({0}, {1, 2, 3}))
+
+    >>> network.add_edge(s, a)
+    >>> network.minimum_cut(s, t)
+    (11, ({0, 1, 2}, {3}))
+
+    >>> network.add_edge(b, t)
+    >>> network.minimum_cut(s, t)
+    Traceback (most recent call last):
+    ...
+    ValueError: Infinite capacity path, flow unbounded above.
+
+    >>> network.minimum_cut(s, t, deadline=0)
+    Traceback (most recent call last):
+    ...
+    TimeoutError: Minimum cut calculation exceeded the deadline.
+    """
+    if source == sink:
+      raise ValueError("The source and the sink of the flow are the same.")
+
+    # Infinite capacities are replaced by a capacity larger than any finite
+    # flow could be.
+    infinity = sum(c for c in self._capacities if c > 0) + 1
+    residual = array('q', (c if c >= 0 else infinity
+                           for c in self._capacities))
+    heads, adjacency = self._heads, self._adjacency
+
+    flow = 0
+    while True:
+      if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError("Minimum cut calculation exceeded the deadline.")
+
+      # Build the level graph of the residual network.
+      level = [-1] * len(self._labels)
+      level[source] = 0
+      queue = deque([source])
+      while queue:
+        node = queue.popleft()
+        for arc in adjacency[node]:
+          head = heads[arc]
+          if residual[arc] > 0 and level[head] < 0:
+            level[head] = level[node] + 1
+            queue.append(head)
+      if level[sink] < 0:
+        break
+
+      # Find a blocking flow in the level graph with depth-first searches,
+      # never retrying the arcs that were found to lead nowhere.
+      next_arc = [0] * len(self._labels)
+      path = list()
+      node = source
+      while True:
+        if node == sink:
+          bottleneck = min(residual[arc] for arc in path)
+          for arc in path:
+            residual[arc] -= bottleneck
+            residual[arc ^ 1] += bottleneck
+          flow += bottleneck
+          if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("Minimum cut calculation exceeded the "
+                               "deadline.")
+          path = list()
+          node = source
+          continue
+
+        arcs = adjacency[node]
+        while next_arc[node] < len(arcs):
+          arc = arcs[next_arc[node]]
+          if residual[arc] > 0 and level[heads[arc]] == level[node] + 1:
+            break
+          next_arc[node] += 1
+        else:
+          # Dead end, step back.
+          level[node] = -1
+          if not path:
+            break
+          node = heads[path.pop() ^ 1]
+          next_arc[node] += 1
+          continue
+
+        path.append(arc)
+        node = heads[arc]
+
+    if flow >= infinity:
+      raise ValueError("Infinite capacity path, flow unbounded above.")
+
+    # The sink side of the cut is the nodes which can still reach the sink.
+    sink_side = {sink}
+    queue = deque([sink])
+    while queue:
+      for arc in adjacency[queue.popleft()]:
+        tail = heads[arc]
+        if tail not in sink_side and residual[arc ^ 1] > 0:
+          sink_side.add(tail)
+          queue.append(tail)
+
+    return flow, (set(range(len(self._labels))) - sink_side, sink_side)
+
+
+@contextmanager
+def _interrupt_at(deadline):
+  """
+  Raise :type TimeoutError: in the managed block when :param deadline: (in the
+  time of :func time.monotonic:) passes, with an alarm signal.
+
+  Signals are only handled on the main thread, and not on every platform, so
+  elsewhere the block is not interrupted.
+  """
+  if deadline is None or not hasattr(signal, 'setitimer') or \
+        threading.current_thread() is not threading.main_thread():
+    yield
+    return
+
+  def _handler(signum, frame):
+    raise TimeoutError("Minimum cut calculation exceeded the deadline.")
+
+  previous_handler = signal.signal(signal.SIGALRM, _handler)
+  try:
+    signal.setitimer(signal.ITIMER_REAL,
+                     max(deadline - time.monotonic(), 1e-6))
+    yield
+  finally:
+    try:
+      signal.setitimer(signal.ITIMER_REAL, 0)
+    finally:
+      signal.signal(signal.SIGALRM, previous_handler)
+
+
+def minimum_cut(flow, source, sink, algorithm='builtin', deadline=None):
+  """
+  Calculate the minimum cut of the :param flow: network between
+  :param source: and :param sink: with the given :param algorithm: (one of
+  :var FLOW_ALGORITHMS:).
+
+  :type TimeoutError: is raised if :param deadline: (in the time of
+  :func time.monotonic:) passes. The networkx algorithms are interrupted by
+  an alarm signal, which is only possible on the main thread of the process
+  (as in the workers of a process pool), otherwise the deadline is only
+  checked before they start.
+
+  :return: The same as :func FlowNetwork.minimum_cut:. The partition of the
+  nodes is the same for every algorithm.
+
+  >>> network = FlowNetwork()
+  >>> s, a, b, c, t = map(network.add_node, 'sabct')
+  >>> for u, v, capacity in [(s, a, 2), (s, b, 2), (a, b, 1), (a, c, 1),
+  ...                        (b, c, 2), (b, t, 1), (c, t, 3)]:
+  ...   network.add_edge(u, v, capacity)
+  >>> for algorithm in sorted(FLOW_ALGORITHMS):
+  ...   print(algorithm, minimum_cut(network, s, t, algorithm))
+  boykov-kolmogorov (4, ({0, 1, 2, 3}, {4}))
+  builtin (4, ({0, 1, 2, 3}, {4}))
+  dinic (4, ({0, 1, 2, 3}, {4}))
+  edmonds-karp (4, ({0, 1, 2, 3}, {4}))
+  preflow-push (4, ({0, 1, 2, 3}, {4}))
+
+  >>> minimum_cut(network, s, t, 'dinic', deadline=0)
+  Traceback (most recent call last):
+  ...
+  TimeoutError: Minimum cut calculation exceeded the deadline.
+  """
+  flow_func = FLOW_ALGORITHMS[algorithm]
+  if flow_func is None:
+    return flow.minimum_cut(source, sink, deadline)
+  if deadline is not None and time.monotonic() > deadline:
+    raise TimeoutError("Minimum cut calculation exceeded the deadline.")
+
+  try:
+    with _interrupt_at(deadline):
+      return nx.minimum_cut(flow.to_networkx(), source, sink,
+                            flow_func=flow_func)
+  except nx.NetworkXUnbounded:
+    raise ValueError("Infinite capacity path, flow unbounded above.")
@@ -88,53 +88,136 @@ def transitive_leveled_successors(graph, node):
   return __transitive_leveled_graph_iteration(graph.successors, node)
 
 
-def simple_cycles(directed_edges):
+def cyclic_components(graph):
+  """
+  Generate the strongly connected components of the directed :param graph:
+  which contain a cycle: the components with more than one node, and the
+  single nodes that have a loop edge.
+
+  Every node of such a component is part of at least one cycle, but unlike
+  enumerating the cycles with :func:`nx.simple_cycles()`, calculating the
+  components takes linear time.
   """
-  Generate shortest simple cycles using a quadratic algorithm.
-  Useful when :func:`nx.simple_cycles()` does not terminate in a reasonable
-  time.
+  for component in nx.strongly_connected_components(graph):
+    if len(component) > 1:
+      yield component
+      continue
 
-  :return: (minimum_length, cycles), where `cycles` is a
-  `dict(Node, [Nodes...])`, for each node listing one shortest path starting
-  from that node. The path is represented as a list of nodes, which always
-  contains the starting node as its prefix and suffix.
+    node = next(iter(component))
+    if graph.has_edge(node, node):
+      yield component
+
+
+def sample_cycle(graph, component):
+  """
+  :return: One cycle of the :param graph: that is inside the cyclic
+  :param component: (see :func:`cyclic_components()`), as the list of its
+  nodes.
+  """
+  edges = nx.find_cycle(graph.subgraph(component), source=min(component))
+  return [u for u, _ in edges]
+
+
+def simple_cycles(directed_edges):
+  """
+  Generate shortest simple cycles using a breadth-first search from every
+  node that is in a cycle. Useful when :func:`nx.simple_cycles()` does not
+  terminate in a reasonable time. (Loop edges are not considered cycles.)
+
+  :return: (minimum_length, cycles), where `cycles` is a sorted list of
+  `(Node, [Nodes...])` pairs, for each node in a shortest cycle of the graph
+  listing one such cycle starting from that node. The cycle is represented as
+  a list of nodes, which always contains the starting node as its prefix and
+  suffix.
   """
   graph = nx.DiGraph(directed_edges)
-  sorted_edges = sorted(directed_edges)
-
-  # Generating the simple_cycles() of the dependency graph is very very costly
-  # at this point, as for ~60 modules they could be the order of or above
-  # 10 billion. Instead, this quadratic algorithm of the adjacency matrix will
-  # try selecting shortest cycles.
-  dependency_paths = dict()
-  for n in sorted_edges:
-    for m in sorted_edges:
-      if n == m:
-        continue
 
-      try:
-        forward_path = next(nx.shortest_simple_paths(graph, n, m))
-        backward_path = next(nx.shortest_simple_paths(graph, m, n))
-      except nx.NetworkXNoPath:
-        # Disregard the exception if a module cannot be reached from another
-        # one.
-        continue
+  # Enumerating the simple_cycles() of the dependency graph is very very
+  # costly, as for ~60 modules they could be the order of or above 10 billion.
+  # Instead, a shortest cycle is searched for every node. Only the nodes in
+  # the same strongly connected component can be part of a cycle with a node.
+  return merge_shortest_cycles(
+    shortest_cycles_in_component(graph.successors, component)
+    for component in nx.strongly_connected_components(graph)
+    if len(component) > 1)
 
-      # Cut the repeated middle element.
-      cycle = forward_path + backward_path[1:]
-      if n not in dependency_paths or len(cycle) < len(dependency_paths[n]):
-        dependency_paths[n] = cycle
 
-  if not dependency_paths:
+def shortest_cycles_in_component(successors, component):
+  """
+  Find the shortest cycles through the nodes of the strongly connected
+  :param component: of a graph, given by the :param successors: function of
+  the graph. (Loop edges are not considered cycles.)
+
+  :return: (minimum_length, cycles), where `cycles` is a dict, listing one
+  cycle for each node through which a cycle of `minimum_length` exists, in
+  the format of :func:`simple_cycles()`. If there are no cycles, (0, dict())
+  is returned.
+  """
+  successors = {n: sorted(m for m in successors(n)
+                          if m in component and m != n)
+                for n in component}
+
+  cycles = dict()
+  minimum_length = None
+  for start in sorted(component):
+    # (Longer cycles than the shortest one found so far are not searched.)
+    cycle = __shortest_cycle_through(successors, start, minimum_length)
+    if not cycle:
+      continue
+    if minimum_length is None or len(cycle) < minimum_length:
+      minimum_length = len(cycle)
+    cycles[start] = cycle
+
+  if minimum_length is None:
+    return 0, dict()
+  return minimum_length, {n: cycle for n, cycle in cycles.items()
+                          if len(cycle) == minimum_length}
+
+
+def merge_shortest_cycles(component_results):
+  """
+  Merge the results of :func:`shortest_cycles_in_component()` for multiple
+  components into the result format of :func:`simple_cycles()`.
+  """
+  component_results = [r for r in component_results if r[0]]
+  if not component_results:
     # If there are no cycles, quit.
     return 0, list()
 
-  cycle_lengths = sorted(
-    map(lambda e: (e[0], len(e[1])), dependency_paths.items()),
-    key=operator.itemgetter(1))
-  cycle_lengths_minimum = min(cycle_lengths, key=operator.itemgetter(1))[1]
-  minimum_long_cycles = sorted(filter(
-    lambda e: len(e[1]) == cycle_lengths_minimum,
-    dependency_paths.items()))
+  minimum_length = min(length for length, _ in component_results)
+  minimum_long_cycles = sorted(
+    item for length, cycles in component_results
+    if length == minimum_length for item in cycles.items())
 
-  return cycle_lengths_minimum, minimum_long_cycles
+  return minimum_length, minimum_long_cycles
+
+
+def __shortest_cycle_through(successors, start, length_limit=None):
+  """
+  Helper function that finds one shortest cycle through :param start: with a
+  breadth-first search in the graph given as the :param successors: lists.
+  Cycles longer (in nodes listed, see :func:`simple_cycles()`) than
+  :param length_limit: are not searched for.
+
+  :return: The cycle, starting and ending with :param start:, or None.
+  """
+  parents = {start: None}
+  level, length = [start], 2
+  while level and (length_limit is None or length <= length_limit):
+    next_level = list()
+    for node in level:
+      for successor in successors[node]:
+        if successor == start:
+          cycle = [start]
+          while node is not None:
+            cycle.append(node)
+            node = parents[node]
+          cycle.reverse()
+          return cycle
+        if successor not in parents:
+          parents[successor] = node
+          next_level.append(successor)
+    level = next_level
+    length += 1
+
+  return None
@@ -3,7 +3,7 @@ import os
 
 from .. import logging
 
-__all__ = ['get_visualizer', 'load_for']
+__all__ = ['get_visualizer', 'is_enabled', 'load_for']
 
 __SELECTED_EXECUTORS = dict()
 __LOADED_IMPL_MODULES = dict()
@@ -33,6 +33,14 @@ def get_visualizer(action):
   return module
 
 
+def is_enabled(action):
+  """
+  :return: Whether the visualisations associated with the given action are
+  actually drawn, and not ignored by the dummy library.
+  """
+  return get_visualizer(action) is __LOADED_IMPL_MODULES.get('actual', None)
+
+
 def load_for(action, should_actually_execute=False):
   """
   Load the implementation module for graph visualisations. In case